@@ -5,20 +5,69 @@ AI Document Validator
 
 import os
 import json
-import base64
+import asyncio
+import hashlib
 import logging
-import re
-from typing import Dict, Optional, Tuple
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterator, List, Literal, Optional, Tuple
 from PIL import Image
 from io import BytesIO
+from collections import Counter
+from dataclasses import dataclass
 
-import openai  # legacy usage for chat.completions (images)
+# aiofiles — неблокуюче читання файлів в async-коді; fallback — asyncio.to_thread
+try:
+    import aiofiles
+except ImportError:
+    aiofiles = None  # type: ignore
+
+# orjson (Rust) швидший за stdlib json; stdlib — як fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+# torchvision (опціонально): швидке JPEG-кодування через libjpeg-turbo / nvJPEG
+try:
+    import torch
+    from torchvision.io import ImageReadMode, decode_image, encode_jpeg
+    from torchvision.transforms.v2.functional import resize as _tv_resize
+except Exception:
+    torch = None  # type: ignore
+
+# pypdfium2 (опціонально): рендер сторінок PDF для постранкової перевірки
+try:
+    import pypdfium2 as pdfium
+except Exception:
+    pdfium = None  # type: ignore
+
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 
-# New client for Responses API (PDF)
+# Async client (Responses API + Files API) для images та PDF
 try:
-    from openai import OpenAI
+    from openai import (
+        AsyncOpenAI, APIConnectionError, APITimeoutError, BadRequestError, InternalServerError,
+        NotFoundError, RateLimitError
+    )
+    # Тимчасові помилки, які варто повторити (429 / 5xx / таймаут / з'єднання)
+    _RETRYABLE_ERRORS: Tuple[type, ...] = (
+        RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+    )
+    # Так OpenAI відповідає на file_id, який вже видалено — закешований id треба перезавантажити
+    _STALE_FILE_ERRORS: Tuple[type, ...] = (BadRequestError, NotFoundError)
 except Exception:
-    OpenAI = None  # type: ignore
+    AsyncOpenAI = None  # type: ignore
+    _RETRYABLE_ERRORS = ()
+    _STALE_FILE_ERRORS = ()
+
+import httpx  # транспорт openai SDK — ставиться разом з ним
+from pydantic import BaseModel, ConfigDict
 
 from prompts import DOCUMENT_PROMPTS, DOCUMENT_TYPE_TO_PROMPT, REJECTION_REASONS
 
@@ -31,16 +80,204 @@ logger = logging.getLogger(__name__)
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 AI_VALIDATION_ENABLED = os.getenv('AI_VALIDATION_ENABLED', 'true').lower() == 'true'
 
-# Ініціалізація OpenAI (legacy) для зображень
-if OPENAI_API_KEY:
-    openai.api_key = OPENAI_API_KEY
-else:
+# Максимум одночасних запитів до OpenAI при пакетній перевірці
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', 10))
+
+# Формат, у який перекодовуються зображення: webp (менший payload) або jpeg (rollback)
+OPENAI_IMAGE_FORMAT = 'jpeg' if os.getenv('OPENAI_IMAGE_FORMAT', 'webp').lower() in ('jpeg', 'jpg') else 'webp'
+
+# Максимальна сторона зображення: GPT-4o ріже high-detail на тайли 512px, більше 1536 не дає точності
+OPENAI_IMAGE_MAX_SIDE = int(os.getenv('OPENAI_IMAGE_MAX_SIDE', 1536))
+# Менші зображення відправляємо з detail=low (один патч замість тайлів)
+OPENAI_IMAGE_LOW_DETAIL_MAX_SIDE = 768
+
+# Ліміт токенів відповіді: JSON за схемою — ~6 полів, реальні відповіді < 200 токенів
+OPENAI_MAX_OUTPUT_TOKENS = int(os.getenv('OPENAI_MAX_OUTPUT_TOKENS', 256))
+
+# Спроби виклику OpenAI (з експоненційним backoff + jitter між ними)
+AI_MAX_ATTEMPTS = int(os.getenv('AI_MAX_ATTEMPTS', 3))
+
+# responses — весь PDF одним запитом; majority_vote — кожна сторінка окремо + голосування
+AI_VALIDATION_PDF_STRATEGY = os.getenv('AI_VALIDATION_PDF_STRATEGY', 'responses').lower()
+# Скільки перших сторінок PDF перевіряти при majority_vote (кожна сторінка — окремий запит)
+AI_PDF_MAX_PAGES = int(os.getenv('AI_PDF_MAX_PAGES', 10))
+AI_PDF_RENDER_DPI = 150
+
+# Персистентний кеш file_id завантажених PDF (спільний для всіх процесів)
+AI_PDF_CACHE_PATH = os.getenv(
+    'AI_PDF_CACHE_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'documents_bot', 'pdf_file_ids.sqlite3')
+)
+# OpenAI зберігає файли обмежений час — старші записи вважаємо недійсними
+AI_PDF_CACHE_TTL = int(os.getenv('AI_PDF_CACHE_TTL', 29 * 24 * 60 * 60))
+
+# realtime — звичайні запити; batch — дозволяє OpenAI Batch API (дешевше, до 24 год)
+AI_VALIDATION_MODE = os.getenv('AI_VALIDATION_MODE', 'realtime').lower()
+
+if not OPENAI_API_KEY:
     logger.warning("OPENAI_API_KEY not set - AI validation will be disabled")
 
-# Ініціалізація нового клієнта для PDF через Responses API
-_responses_client = None
-if OPENAI_API_KEY and OpenAI is not None:
-    _responses_client = OpenAI(api_key=OPENAI_API_KEY)
+# event loop -> AsyncOpenAI: keep-alive з'єднання httpx прив'язані до loop, в якому відкриті
+_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]' = weakref.WeakKeyDictionary()
+
+def _get_client():
+    """Лінива ініціалізація async клієнта (images + PDF) зі спільним пулом з'єднань — один на event loop"""
+    if not OPENAI_API_KEY or AsyncOpenAI is None:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        )
+        # retry робимо самі (tenacity), щоб не множити спроби SDK на наші
+        client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0, http_client=http_client)
+        _clients[loop] = client
+    return client
+
+async def _close_client() -> None:
+    """Закрити клієнт поточного event loop (перед тим, як loop буде закрито)"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+def _file_blake2b(path: str, chunksize: int = 1 << 20) -> str:
+    """BLAKE2b-хеш файлу, читаючи його шматками (без піків пам'яті на великих PDF)"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunksize):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+async def _read_bytes_async(path: str) -> bytes:
+    """Прочитати файл, не блокуючи event loop"""
+    if aiofiles is not None:
+        async with aiofiles.open(path, 'rb') as f:
+            return await f.read()
+    return await asyncio.to_thread(_read_bytes, path)
+
+def _image_detail(width: int, height: int) -> str:
+    return 'low' if max(width, height) < OPENAI_IMAGE_LOW_DETAIL_MAX_SIDE else 'high'
+
+def _file_ext(file_path: str) -> str:
+    return os.path.splitext(file_path)[1].lower()
+
+def _json_loads(text):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+_IMAGE_EXTENSIONS: frozenset[str] = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'})
+
+@lru_cache(maxsize=32)
+def _encode_image_cached(file_path: str, mtime_ns: int, size: int) -> Tuple[bytes, str, str]:
+    """
+    Підготувати зображення: (bytes, формат, detail). Кеш на рівні модуля (не тримає валідатор);
+    mtime_ns і size входять у ключ кешу: змінений файл кодується заново.
+    Помилку кодування піднімає — lru_cache не кешує винятки, тож повтор пробує ще раз
+    """
+    # RGB-файл потрібного формату в межах OPENAI_IMAGE_MAX_SIDE відправляємо як є — без перекодування
+    try:
+        with Image.open(file_path) as img:
+            width, height = img.size
+            passthrough = (
+                img.format == OPENAI_IMAGE_FORMAT.upper() and img.mode == 'RGB'
+                and max(width, height) <= OPENAI_IMAGE_MAX_SIDE
+            )
+        if passthrough:
+            return _read_bytes(file_path), OPENAI_IMAGE_FORMAT, _image_detail(width, height)
+    except Exception:
+        pass
+
+    # torchvision вміє тільки JPEG
+    if torch is not None and OPENAI_IMAGE_FORMAT == 'jpeg':
+        try:
+            return _encode_image_torchvision(file_path)
+        except Exception as e:
+            # напр. BMP/TIFF, які torchvision не декодує — йдемо через PIL
+            logger.debug(f"torchvision encode failed, falling back to PIL: {e}")
+
+    with Image.open(file_path) as img:
+        # WebP підтримує альфа-канал, JPEG — ні
+        allowed_modes = ('RGB', 'RGBA') if OPENAI_IMAGE_FORMAT == 'webp' else ('RGB',)
+        if img.mode not in allowed_modes:
+            img = img.convert('RGB')
+
+        max_size = (OPENAI_IMAGE_MAX_SIDE, OPENAI_IMAGE_MAX_SIDE)
+        if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
+            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+            logger.info(f"Resized image to {img.size}")
+
+        buffer = BytesIO()
+        if OPENAI_IMAGE_FORMAT == 'webp':
+            img.save(buffer, format='WEBP', quality=80, method=4)
+        else:
+            img.save(buffer, format='JPEG', quality=85)
+        return buffer.getvalue(), OPENAI_IMAGE_FORMAT, _image_detail(*img.size)
+
+def _encode_image_torchvision(file_path: str) -> Tuple[bytes, str, str]:
+    """Те саме що _encode_image_cached, але через torchvision (на CUDA — nvJPEG)"""
+    with open(file_path, 'rb') as f:
+        data = torch.frombuffer(bytearray(f.read()), dtype=torch.uint8)
+    img = decode_image(data, mode=ImageReadMode.RGB)
+
+    max_side = OPENAI_IMAGE_MAX_SIDE
+    height, width = img.shape[-2], img.shape[-1]
+    if height > max_side or width > max_side:
+        scale = max_side / max(height, width)
+        new_size = [max(1, round(height * scale)), max(1, round(width * scale))]
+        img = _tv_resize(img, new_size, antialias=True)
+        logger.info(f"Resized image to {(new_size[1], new_size[0])}")
+
+    if torch.cuda.is_available():
+        img = img.cuda()
+
+    image_bytes = encode_jpeg(img, quality=85).cpu().numpy().tobytes()
+    return image_bytes, 'jpeg', _image_detail(img.shape[-1], img.shape[-2])
+
+# ============================================================================
+# СХЕМА ВІДПОВІДІ AI (structured outputs)
+# ============================================================================
+
+class AIDocumentCheckSchema(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+
+    status: Literal['ACCEPTED', 'REJECTED', 'UNCERTAIN']
+    detected_document: str
+    error_code: Optional[str]
+
+class AIValidationSchema(BaseModel):
+    """Формат відповіді, який очікує _parse_ai_response"""
+    model_config = ConfigDict(extra='forbid')
+
+    quality_check: Literal['PASSED', 'FAILED']
+    error_code: Optional[str]
+    document_check: AIDocumentCheckSchema
+
+# strict=True: модель гарантовано повертає валідний JSON за схемою
+AI_RESPONSE_SCHEMA = AIValidationSchema.model_json_schema()
+AI_RESPONSE_FORMAT_NAME = 'document_validation'
+
+@dataclass(slots=True)
+class _AIRaw:
+    """Поля відповіді AI, потрібні для рішення (витягуються одним проходом)"""
+    quality_check: str
+    error_code: Optional[str]
+    doc_status: str
+    doc_error_code: Optional[str]
+
+    @classmethod
+    def from_response(cls, ai_response: Dict) -> '_AIRaw':
+        document_check = ai_response.get('document_check') or {}
+        return cls(
+            quality_check=ai_response.get('quality_check', 'PASSED'),
+            error_code=ai_response.get('error_code'),
+            doc_status=document_check.get('status', 'UNCERTAIN'),
+            doc_error_code=document_check.get('error_code'),
+        )
 
 # ============================================================================
 # VALIDATION РЕЗУЛЬТАТИ
@@ -100,6 +337,125 @@ class ValidationResult:
             'ai_response': self.ai_response
         }
 
+    def to_json_bytes(self) -> bytes:
+        """Серіалізувати to_dict() у JSON (UTF-8 bytes)"""
+        if orjson is not None:
+            return orjson.dumps(self.to_dict())
+        return json.dumps(self.to_dict(), ensure_ascii=False).encode('utf-8')
+
+# ============================================================================
+# FILE_ID CACHE
+# ============================================================================
+
+class FileIdCache:
+    """
+    sqlite-кеш: хеш вмісту файлу (PDF / зображення) -> file_id у OpenAI Files API.
+    Файл відкривається при першому зверненні (не при імпорті модуля), прострочені записи
+    видаляються у фоновому потоці
+    """
+
+    def __init__(self, path: str, ttl: int):
+        self.path = path
+        self.ttl = ttl
+        self.enabled = True
+        self._opened = False
+        self._open_lock = threading.Lock()
+
+    def _ensure_open(self) -> bool:
+        """Створити файл і таблицю при першому зверненні; False — кеш вимкнено"""
+        if self._opened:
+            return self.enabled
+        with self._open_lock:
+            if not self._opened:
+                self._open()
+                self._opened = True
+        return self.enabled
+
+    def _open(self) -> None:
+        path = self.path
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS file_id_cache (
+                        hash TEXT PRIMARY KEY,
+                        file_id TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                """)
+                # таблиця до перейменування (коли кешувались лише PDF) — переносимо записи
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pdf_cache'").fetchone():
+                    conn.execute("INSERT OR IGNORE INTO file_id_cache SELECT hash, file_id, created_at FROM pdf_cache")
+                    conn.execute("DROP TABLE pdf_cache")
+        except Exception as e:
+            logger.warning(f"OpenAI file_id cache disabled ({path}): {e}")
+            self.enabled = False
+            return
+        threading.Thread(target=self._prune_quietly, name='file-id-cache-prune', daemon=True).start()
+
+    def _prune_quietly(self) -> None:
+        try:
+            self.prune()
+        except Exception as e:
+            logger.warning(f"OpenAI file_id cache prune failed: {e}")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # окреме з'єднання на виклик — безпечно для потоків і процесів; commit і close на виході
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, file_hash: str) -> Optional[str]:
+        if not self._ensure_open():
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT file_id FROM file_id_cache WHERE hash = ? AND created_at >= ?",
+                    (file_hash, time.time() - self.ttl)
+                ).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"OpenAI file_id cache read error: {e}")
+            return None
+
+    def set(self, file_hash: str, file_id: str) -> None:
+        if not self._ensure_open():
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO file_id_cache (hash, file_id, created_at) VALUES (?, ?, ?)",
+                    (file_hash, file_id, time.time())
+                )
+        except Exception as e:
+            logger.error(f"OpenAI file_id cache write error: {e}")
+
+    def delete(self, file_hash: str) -> None:
+        """Забути file_id (OpenAI його вже не знає)"""
+        if not self._ensure_open():
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM file_id_cache WHERE hash = ?", (file_hash,))
+        except Exception as e:
+            logger.error(f"OpenAI file_id cache delete error: {e}")
+
+    def prune(self) -> int:
+        """Видалити записи, старші за TTL"""
+        with self._connect() as conn:
+            deleted = conn.execute(
+                "DELETE FROM file_id_cache WHERE created_at < ?",
+                (time.time() - self.ttl,)
+            ).rowcount
+        if deleted:
+            logger.info(f"Pruned {deleted} expired OpenAI file_id cache entries")
+        return deleted
+
 # ============================================================================
 # AI DOCUMENT VALIDATOR
 # ============================================================================
@@ -108,89 +464,21 @@ class AIDocumentValidator:
     """Валідатор документів за допомогою GPT-4 Vision"""
 
     def __init__(self):
-        self.enabled = AI_VALIDATION_ENABLED and OPENAI_API_KEY is not None
+        self.enabled = AI_VALIDATION_ENABLED and OPENAI_API_KEY is not None and AsyncOpenAI is not None
 
         # Моделі (можеш винести в env при бажанні)
         self.image_model = os.getenv("OPENAI_IMAGE_MODEL", "gpt-4o")
         self.pdf_model = os.getenv("OPENAI_PDF_MODEL", "gpt-4o")  # Responses API model
 
-        # кеш, щоб не аплоадити один і той самий pdf повторно
-        self._pdf_file_id_cache: Dict[Tuple[str, int], str] = {}
-
-    # ---------------- JSON cleaning helpers ----------------
-
-    def _extract_json_text(self, text: str) -> str:
-        """
-        Витягує перший JSON-об'єкт з довільного тексту.
-        Підтримує випадки:
-        - ```json ... ```
-        - текст до/після JSON
-        - просто валідний JSON
-        """
-        if not text:
-            raise ValueError("Empty model response")
-
-        t = text.strip()
-
-        # 1) прибираємо markdown code fences на початку/в кінці
-        #    ```json\n{...}\n```  ->  {...}
-        if t.startswith("```"):
-            t = re.sub(r"^```[a-zA-Z]*\s*", "", t)
-            t = re.sub(r"\s*```$", "", t).strip()
-
-        # 2) якщо вже чистий json-об'єкт
-        if t.startswith("{") and t.endswith("}"):
-            return t
-
-        # 3) знаходимо перший JSON-об'єкт по балансу фігурних дужок
-        start = t.find("{")
-        if start == -1:
-            raise ValueError("No '{' found in model response")
-
-        depth = 0
-        in_string = False
-        escape = False
-
-        for i in range(start, len(t)):
-            ch = t[i]
-
-            # коректно ігноруємо дужки всередині строк
-            if in_string:
-                if escape:
-                    escape = False
-                elif ch == "\\":
-                    escape = True
-                elif ch == '"':
-                    in_string = False
-                continue
-            else:
-                if ch == '"':
-                    in_string = True
-                    continue
-
-            if ch == "{":
-                depth += 1
-            elif ch == "}":
-                depth -= 1
-                if depth == 0:
-                    return t[start:i + 1]
-
-        raise ValueError("JSON object not closed in model response")
+        # кеш, щоб не аплоадити один і той самий файл повторно (між процесами/рестартами)
+        self._file_id_cache = FileIdCache(AI_PDF_CACHE_PATH, AI_PDF_CACHE_TTL)
 
-    def _safe_json_loads(self, text: str) -> Dict:
-        """
-        1) пробує json.loads(text)
-        2) якщо падає — чистить текст і пробує ще раз
-        """
-        try:
-            return json.loads(text)
-        except Exception:
-            cleaned = self._extract_json_text(text)
-            return json.loads(cleaned)
+        # Batch API використовується тільки для неінтерактивних перевірок
+        self.batch_mode = self.enabled and AI_VALIDATION_MODE == 'batch'
 
     # ---------------- main flow ----------------
 
-    def validate_document(self, file_path: str, document_type: str) -> Optional[ValidationResult]:
+    async def validate_document(self, file_path: str, document_type: str) -> Optional[ValidationResult]:
         """Перевірити документ за допомогою AI"""
         if not self.enabled:
             logger.info("AI validation is disabled")
@@ -207,12 +495,13 @@ class AIDocumentValidator:
                 logger.error(f"Prompt not found for document type: {document_type}")
                 return None
 
-            ext = os.path.splitext(file_path.lower())[1]
+            ext = _file_ext(file_path)
 
             # ✅ IMAGE
-            if self._is_image_file(file_path):
-                base64_image = self._encode_image(file_path)
-                if not base64_image:
+            if ext in _IMAGE_EXTENSIONS:
+                # PIL блокує потік — виносимо в executor, щоб не гальмувати event loop
+                encoded = await asyncio.to_thread(self._encode_image, file_path)
+                if not encoded:
                     logger.error(f"Failed to encode image: {file_path}")
                     return ValidationResult(
                         status='uncertain',
@@ -221,7 +510,7 @@ class AIDocumentValidator:
                     )
 
                 logger.info(f"Calling GPT-4 Vision (images) for document type: {document_type}")
-                ai_response = self._call_gpt4_vision(prompt, base64_image)
+                ai_response = await self._call_gpt4_vision(prompt, *encoded)
 
                 result = self._parse_ai_response(ai_response)
                 logger.info(f"AI validation result: {result.status} (error_code: {result.error_code})")
@@ -229,12 +518,16 @@ class AIDocumentValidator:
 
             # ✅ PDF
             if ext == ".pdf":
-                if _responses_client is None:
-                    logger.warning("Responses client is not available (upgrade openai sdk). Skipping PDF AI validation.")
-                    return None
+                pages = None
+                if AI_VALIDATION_PDF_STRATEGY == 'majority_vote' and pdfium is not None:
+                    pages = await asyncio.to_thread(self._split_pdf_pages, file_path)
 
-                logger.info(f"Calling OpenAI Responses (PDF) for document type: {document_type}")
-                ai_response = self._call_pdf_responses(prompt, file_path)
+                if pages:
+                    logger.info(f"Calling GPT-4 Vision per page ({len(pages)} pages) for document type: {document_type}")
+                    ai_response = await self._call_gpt4_vision_per_page(prompt, pages)
+                else:
+                    logger.info(f"Calling OpenAI Responses (PDF) for document type: {document_type}")
+                    ai_response = await self._call_pdf_responses(prompt, file_path)
 
                 result = self._parse_ai_response(ai_response)
                 logger.info(f"AI validation result: {result.status} (error_code: {result.error_code})")
@@ -252,171 +545,473 @@ class AIDocumentValidator:
                 reason=f'Помилка AI-перевірки: {str(e)}'
             )
 
-    def _is_image_file(self, file_path: str) -> bool:
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
-        _, ext = os.path.splitext(file_path.lower())
-        return ext in image_extensions
+    def validate_document_sync(self, file_path: str, document_type: str) -> Optional[ValidationResult]:
+        """Синхронна обгортка над validate_document (для скриптів без event loop)"""
+        async def _run() -> Optional[ValidationResult]:
+            try:
+                return await self.validate_document(file_path, document_type)
+            finally:
+                # asyncio.run закриває loop — з'єднання клієнта з ним вже не перевикористати
+                await _close_client()
 
-    def _encode_image(self, file_path: str) -> Optional[str]:
-        """Конвертувати зображення в base64"""
-        try:
-            with Image.open(file_path) as img:
-                if img.mode not in ('RGB', 'RGBA'):
-                    img = img.convert('RGB')
+        return asyncio.run(_run())
+
+    async def validate_documents_batch(
+        self,
+        items: List[Tuple[str, str]]
+    ) -> List[Optional[ValidationResult]]:
+        """
+        Перевірити кілька документів паралельно.
+        items: список (file_path, document_type); результат у тому ж порядку.
+        """
+        semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
 
-                max_size = (2048, 2048)
-                if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
-                    img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                    logger.info(f"Resized image to {img.size}")
+        async def _validate_one(file_path: str, document_type: str) -> Optional[ValidationResult]:
+            async with semaphore:
+                return await self.validate_document(file_path, document_type)
 
-                buffer = BytesIO()
-                img.save(buffer, format='JPEG', quality=85)
-                image_bytes = buffer.getvalue()
-                return base64.b64encode(image_bytes).decode('utf-8')
+        results = await asyncio.gather(
+            *(_validate_one(path, doc_type) for path, doc_type in items),
+            return_exceptions=True
+        )
 
+        # validate_document сам ловить помилки, але gather не має зупинятися через один збій
+        final: List[Optional[ValidationResult]] = []
+        for (path, _), result in zip(items, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Error during batch AI validation for {path}: {result}")
+                final.append(ValidationResult(
+                    status='uncertain',
+                    error_code='uncertain',
+                    reason=f'Помилка AI-перевірки: {str(result)}'
+                ))
+            else:
+                final.append(result)
+        return final
+
+    def _encode_image(self, file_path: str) -> Optional[Tuple[bytes, str, str]]:
+        """Підготувати зображення: (bytes, формат, detail), з кешем по path + mtime + size"""
+        try:
+            st = os.stat(file_path)
+            return _encode_image_cached(file_path, st.st_mtime_ns, st.st_size)
         except Exception as e:
+            # невдача не потрапляє в кеш — наступна спроба кодує файл заново
             logger.error(f"Error encoding image: {e}")
             return None
 
-    def _call_gpt4_vision(self, prompt: str, base64_image: str) -> Dict:
-        """Викликати GPT-4 Vision API (images) через Chat Completions"""
+    async def _call_gpt4_vision(self, prompt: str, image_bytes: bytes, image_format: str, detail: str = 'high') -> Dict:
+        """Викликати GPT-4 Vision (images) через Responses API: зображення -> input_image (file_id)"""
         try:
-            response = openai.chat.completions.create(
-                model=self.image_model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}",
-                                    "detail": "high"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=1000,
-                temperature=0.1,
-                response_format={"type": "json_object"}
+            response = await self._create_with_file(
+                "GPT-4 Vision",
+                self.image_model,
+                prompt,
+                lambda refresh: self._upload_image_get_file_id(image_bytes, image_format, refresh),
+                lambda file_id: {"type": "input_image", "file_id": file_id, "detail": detail},
             )
 
-            content = response.choices[0].message.content or ""
+            content = (getattr(response, "output_text", "") or "").strip()
             logger.debug(f"GPT-4 Vision raw response: {content}")
 
-            # ✅ безопасный парсинг (на случай если вдруг прилетит мусор)
-            return self._safe_json_loads(content)
+            return _json_loads(content)
 
         except Exception as e:
             logger.error(f"Error calling GPT-4 Vision API: {e}")
             raise
 
+    # ---------------- PDF per page (majority vote) ----------------
+
+    def _split_pdf_pages(self, pdf_path: str) -> List[Tuple[bytes, str, str]]:
+        """Відрендерити перші AI_PDF_MAX_PAGES сторінок PDF у (JPEG bytes, формат, detail)"""
+        pages: List[Tuple[bytes, str, str]] = []
+        try:
+            pdf = pdfium.PdfDocument(pdf_path)
+            try:
+                for i in range(min(len(pdf), AI_PDF_MAX_PAGES)):
+                    page = pdf[i]
+                    # Не рендеримо більше OPENAI_IMAGE_MAX_SIDE по довшій стороні
+                    scale = min(AI_PDF_RENDER_DPI / 72, OPENAI_IMAGE_MAX_SIDE / max(page.get_size()))
+                    image = page.render(scale=scale).to_pil().convert('RGB')
+                    buffer = BytesIO()
+                    image.save(buffer, format='JPEG', quality=85)
+                    pages.append((buffer.getvalue(), 'jpeg', _image_detail(*image.size)))
+            finally:
+                pdf.close()
+        except Exception as e:
+            logger.error(f"Error rendering PDF pages: {e}")
+            return []
+        return pages
+
+    async def _call_gpt4_vision_per_page(self, prompt: str, pages: List[Tuple[bytes, str, str]]) -> Dict:
+        """Перевірити кожну сторінку окремим запитом і агрегувати результат голосуванням"""
+        semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+
+        async def _call_page(image_bytes: bytes, image_format: str, detail: str) -> Dict:
+            async with semaphore:
+                return await self._call_gpt4_vision(prompt, image_bytes, image_format, detail)
+
+        results = await asyncio.gather(*(_call_page(*p) for p in pages), return_exceptions=True)
+        page_responses = [r for r in results if isinstance(r, dict)]
+        failed = len(results) - len(page_responses)
+        if failed:
+            logger.warning(f"{failed}/{len(results)} PDF page validations failed")
+
+        return self._aggregate_page_responses(page_responses, failed)
+
+    @staticmethod
+    def _aggregate_page_responses(page_responses: List[Dict], failed: int = 0) -> Dict:
+        """
+        Більшість голосів по document_check.status (нічия або збої -> UNCERTAIN),
+        quality_check — найгірший серед сторінок.
+        """
+        votes = Counter(
+            (r.get('document_check') or {}).get('status', 'UNCERTAIN') for r in page_responses
+        )
+        votes['UNCERTAIN'] += failed
+
+        ranked = votes.most_common()
+        if not ranked or (len(ranked) > 1 and ranked[0][1] == ranked[1][1]):
+            status = 'UNCERTAIN'
+        else:
+            status = ranked[0][0]
+
+        failed_quality = [r for r in page_responses if r.get('quality_check') == 'FAILED']
+        quality_check = 'FAILED' if failed_quality else 'PASSED'
+        quality_error = failed_quality[0].get('error_code') if failed_quality else None
+
+        doc_error = None
+        for r in page_responses:
+            check = r.get('document_check') or {}
+            if check.get('status') == status and check.get('error_code'):
+                doc_error = check['error_code']
+                break
+
+        return {
+            'quality_check': quality_check,
+            'error_code': quality_error,
+            'document_check': {
+                'status': status,
+                'detected_document': f"majority vote over {len(page_responses) + failed} pages: {dict(votes)}",
+                'error_code': doc_error
+            },
+            'pages': page_responses
+        }
+
     # ---------------- PDF via Responses API ----------------
 
-    def _upload_pdf_get_file_id(self, pdf_path: str) -> str:
-        """Upload PDF to Files API and return file_id (cached)."""
-        assert _responses_client is not None
+    async def _upload_pdf_get_file_id(self, pdf_path: str, refresh: bool = False) -> Tuple[str, bool]:
+        """
+        Upload PDF to Files API and return (file_id, from_cache).
+        refresh=True — закешований file_id недійсний: видаляємо запис і завантажуємо заново.
+        """
+        client = _get_client()
+        assert client is not None
+
+        file_hash = await asyncio.to_thread(_file_blake2b, pdf_path)
 
-        size = os.path.getsize(pdf_path)
-        key = (pdf_path, size)
-        if key in self._pdf_file_id_cache:
-            return self._pdf_file_id_cache[key]
+        if refresh:
+            await asyncio.to_thread(self._file_id_cache.delete, file_hash)
+        else:
+            cached = await asyncio.to_thread(self._file_id_cache.get, file_hash)
+            if cached:
+                return cached, True
 
-        with open(pdf_path, "rb") as f:
-            up = _responses_client.files.create(file=f, purpose="user_data")
+        data = await _read_bytes_async(pdf_path)
+        size = len(data)
+        up = await client.files.create(file=(os.path.basename(pdf_path), data), purpose="user_data")
 
-        self._pdf_file_id_cache[key] = up.id
+        await asyncio.to_thread(self._file_id_cache.set, file_hash, up.id)
         logger.info(f"Uploaded PDF to OpenAI Files API: file_id={up.id}, size={size}")
-        return up.id
+        return up.id, False
+
+    async def _upload_image_get_file_id(
+        self, image_bytes: bytes, image_format: str, refresh: bool = False
+    ) -> Tuple[str, bool]:
+        """Upload image bytes to Files API (purpose=vision) and return (file_id, from_cache); refresh — як для PDF."""
+        client = _get_client()
+        assert client is not None
+
+        # префікс — щоб ключі зображень не перетиналися з ключами PDF
+        file_hash = 'vision:' + hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+        if refresh:
+            await asyncio.to_thread(self._file_id_cache.delete, file_hash)
+        else:
+            cached = await asyncio.to_thread(self._file_id_cache.get, file_hash)
+            if cached:
+                return cached, True
+
+        up = await client.files.create(file=(f"image.{image_format}", image_bytes), purpose="vision")
 
-    def _call_pdf_responses(self, prompt: str, pdf_path: str) -> Dict:
+        await asyncio.to_thread(self._file_id_cache.set, file_hash, up.id)
+        logger.info(f"Uploaded image to OpenAI Files API: file_id={up.id}, size={len(image_bytes)}")
+        return up.id, False
+
+    async def _call_pdf_responses(self, prompt: str, pdf_path: str) -> Dict:
         """
         Викликати OpenAI Responses API для PDF:
         - PDF -> input_file (file_id)
         - + input_text prompt
-        Очікуємо строгий JSON у відповіді (але чистимо, якщо модель додала ```json).
+        Відповідь — JSON за схемою AIValidationSchema (structured outputs).
         """
-        assert _responses_client is not None
+        resp = await self._create_with_file(
+            "Responses (PDF)",
+            self.pdf_model,
+            prompt,
+            lambda refresh: self._upload_pdf_get_file_id(pdf_path, refresh),
+            lambda file_id: {"type": "input_file", "file_id": file_id},
+        )
 
-        file_id = self._upload_pdf_get_file_id(pdf_path)
+        raw_text = (getattr(resp, "output_text", "") or "").strip()
+        logger.info(f"OpenAI raw response text (PDF): {raw_text[:500]}{'...' if len(raw_text) > 500 else ''}")
 
-        # (опціонально) підсилюємо вимогу до формату
-        strict_prompt = (
-            "Відповідай ТІЛЬКИ валідним JSON-об’єктом. "
-            "Без markdown, без ```json, без пояснень. "
-            "Починай відповідь з '{' і закінчуй '}'.\n\n"
-            + prompt
-        )
+        return _json_loads(raw_text)
+
+    async def _create_with_file(self, what: str, model: str, prompt: str, upload, document_part):
+        """
+        responses.create з prompt + файлом. upload(refresh) -> (file_id, from_cache), document_part(file_id) -> частина input.
+        Якщо OpenAI відхиляє закешований file_id (файл вже видалено) — перезавантажуємо файл і повторюємо один раз.
+        """
+        client = _get_client()
+        assert client is not None
+
+        file_id, from_cache = await upload(False)
+        while True:
+            try:
+                return await self._create_with_retry(
+                    what,
+                    client.responses.create,
+                    model=model,
+                    input=[
+                        {
+                            "role": "user",
+                            "content": [
+                                {"type": "input_text", "text": prompt},
+                                document_part(file_id),
+                            ],
+                        }
+                    ],
+                    max_output_tokens=OPENAI_MAX_OUTPUT_TOKENS,
+                    temperature=0.1,
+                    text=self._responses_text_format(),
+                )
+            except _STALE_FILE_ERRORS as e:
+                if not from_cache:
+                    raise
+                logger.warning(f"Cached OpenAI file_id {file_id} rejected ({e}), re-uploading")
+                file_id, from_cache = await upload(True)
+
+    async def _create_with_retry(self, what: str, create, **kwargs):
+        """Виклик OpenAI з повтором на 429/5xx/таймаут (експоненційний backoff + jitter)"""
+        async for attempt in AsyncRetrying(
+            retry=retry_if_exception_type(_RETRYABLE_ERRORS),
+            wait=wait_random_exponential(min=1, max=30),
+            stop=stop_after_attempt(AI_MAX_ATTEMPTS),
+            reraise=True
+        ):
+            with attempt:
+                attempt_number = attempt.retry_state.attempt_number
+                if attempt_number > 1:
+                    logger.warning(f"Retrying OpenAI {what} call (attempt {attempt_number}/{AI_MAX_ATTEMPTS})")
+                return await create(**kwargs)
+
+    @staticmethod
+    def _responses_text_format() -> Dict:
+        """Параметр text для Responses API: strict JSON schema"""
+        return {
+            "format": {
+                "type": "json_schema",
+                "name": AI_RESPONSE_FORMAT_NAME,
+                "schema": AI_RESPONSE_SCHEMA,
+                "strict": True
+            }
+        }
+
+    # ---------------- Batch API (non-interactive) ----------------
+
+    async def _build_batch_body(self, file_path: str, document_type: str) -> Optional[Dict]:
+        """Сформувати body запиту /v1/responses для одного документа (або None)"""
+        prompt_key = DOCUMENT_TYPE_TO_PROMPT.get(document_type)
+        prompt = DOCUMENT_PROMPTS.get(prompt_key) if prompt_key else None
+        if not prompt:
+            return None
 
-        resp = _responses_client.responses.create(
-            model=self.pdf_model,
-            input=[
+        ext = _file_ext(file_path)
+        if ext in _IMAGE_EXTENSIONS:
+            encoded = await asyncio.to_thread(self._encode_image, file_path)
+            if not encoded:
+                logger.error(f"Failed to encode image for batch: {file_path}")
+                return None
+            image_bytes, image_format, detail = encoded
+            model = self.image_model
+            document_part = {
+                "type": "input_image",
+                "file_id": (await self._upload_image_get_file_id(image_bytes, image_format))[0],
+                "detail": detail
+            }
+        elif ext == ".pdf":
+            model = self.pdf_model
+            document_part = {"type": "input_file", "file_id": (await self._upload_pdf_get_file_id(file_path))[0]}
+        else:
+            return None
+
+        return {
+            "model": model,
+            "input": [
                 {
                     "role": "user",
                     "content": [
-                        {"type": "input_text", "text": strict_prompt},
-                        {"type": "input_file", "file_id": file_id},
+                        {"type": "input_text", "text": prompt},
+                        document_part,
                     ],
                 }
             ],
-            max_output_tokens=1000,
-            temperature=0.1,
+            "max_output_tokens": OPENAI_MAX_OUTPUT_TOKENS,
+            "temperature": 0.1,
+            "text": self._responses_text_format(),
+        }
+
+    async def submit_batch(self, items: List[Tuple[str, str, str]]) -> Optional[str]:
+        """
+        Відправити документи на перевірку через OpenAI Batch API.
+        items: список (custom_id, file_path, document_type). Повертає batch_id або None.
+        """
+        if not self.batch_mode:
+            logger.info("Batch AI validation is disabled (AI_VALIDATION_MODE != batch)")
+            return None
+        client = _get_client()
+        assert client is not None
+
+        lines = []
+        for custom_id, file_path, document_type in items:
+            try:
+                body = await self._build_batch_body(file_path, document_type)
+            except Exception as e:
+                logger.error(f"Error preparing batch item {custom_id}: {e}")
+                continue
+            if body is None:
+                continue
+            lines.append(json.dumps({
+                "custom_id": str(custom_id),
+                "method": "POST",
+                "url": "/v1/responses",
+                "body": body
+            }, ensure_ascii=False))
+
+        if not lines:
+            logger.info("No documents to submit for batch AI validation")
+            return None
+
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False) as f:
+            f.write("\n".join(lines))
+            batch_input_path = f.name
+
+        try:
+            with open(batch_input_path, "rb") as f:
+                batch_file = await client.files.create(file=f, purpose="batch")
+        finally:
+            os.remove(batch_input_path)
+
+        batch = await client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/responses",
+            completion_window="24h"
         )
+        logger.info(f"Submitted AI validation batch: batch_id={batch.id}, documents={len(lines)}")
+        return batch.id
 
-        raw_text = (getattr(resp, "output_text", "") or "").strip()
-        logger.info(f"OpenAI raw response text (PDF): {raw_text[:500]}{'...' if len(raw_text) > 500 else ''}")
+    async def poll_batch(self, batch_id: str) -> Optional[Dict[str, ValidationResult]]:
+        """
+        Перевірити стан batch'а. Поки він не завершений — повертає None,
+        після завершення — словник custom_id -> ValidationResult.
+        """
+        client = _get_client()
+        assert client is not None
+
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status != 'completed':
+            logger.info(f"AI validation batch {batch_id} status: {batch.status}")
+            return None
+
+        results: Dict[str, ValidationResult] = {}
+        if not batch.output_file_id:
+            logger.warning(f"AI validation batch {batch_id} completed without output file")
+            return results
+
+        content = await client.files.content(batch.output_file_id)
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            item = _json_loads(line)
+            custom_id = item.get('custom_id')
+            try:
+                response = item.get('response') or {}
+                if response.get('status_code') != 200:
+                    raise ValueError(f"status_code={response.get('status_code')}, error={item.get('error')}")
+                raw_text = self._batch_output_text(response.get('body') or {})
+                results[custom_id] = self._parse_ai_response(_json_loads(raw_text))
+            except Exception as e:
+                logger.error(f"Error parsing batch result {custom_id}: {e}")
+                results[custom_id] = ValidationResult(
+                    status='uncertain',
+                    error_code='uncertain',
+                    reason=f'Помилка AI-перевірки: {str(e)}'
+                )
 
-        # ✅ чистим и парсим
-        return self._safe_json_loads(raw_text)
+        logger.info(f"AI validation batch {batch_id} parsed: {len(results)} results")
+        return results
+
+    @staticmethod
+    def _batch_output_text(body: Dict) -> str:
+        """Зібрати output_text з сирого JSON відповіді Responses API"""
+        parts = []
+        for output in body.get('output', []):
+            if output.get('type') != 'message':
+                continue
+            for content in output.get('content', []):
+                if content.get('type') == 'output_text':
+                    parts.append(content.get('text', ''))
+        return "".join(parts).strip()
 
     # ---------------- parse response ----------------
 
     def _parse_ai_response(self, ai_response: Dict) -> ValidationResult:
         """Парсити відповідь від AI та конвертувати в ValidationResult"""
         try:
-            quality_check = ai_response.get('quality_check', 'PASSED')
-            error_code = ai_response.get('error_code')
-            document_check = ai_response.get('document_check', {})
-            doc_status = document_check.get('status', 'UNCERTAIN')
-            doc_error_code = document_check.get('error_code')
-
-            final_error_code = doc_error_code or error_code
-
-            if quality_check == 'FAILED':
-                return ValidationResult(
-                    status='rejected',
-                    error_code=final_error_code or 'poor_quality',
-                    reason='Документ не пройшов перевірку якості',
-                    ai_response=ai_response
-                )
-
-            if doc_status == 'REJECTED':
-                return ValidationResult(
-                    status='rejected',
-                    error_code=final_error_code or 'wrong_document',
-                    reason='Невірний тип документа',
-                    ai_response=ai_response
-                )
-
-            elif doc_status == 'UNCERTAIN':
-                return ValidationResult(
-                    status='uncertain',
-                    error_code=final_error_code or 'uncertain',
-                    reason='Документ потребує ручної перевірки',
-                    ai_response=ai_response
-                )
+            raw = _AIRaw.from_response(ai_response)
+            final_error_code = raw.doc_error_code or raw.error_code
 
-            elif doc_status == 'ACCEPTED':
-                return ValidationResult(
-                    status='accepted',
-                    error_code=None,
-                    reason='Документ прийнято',
-                    ai_response=ai_response
-                )
+            match (raw.quality_check, raw.doc_status):
+                case ('FAILED', _):
+                    return ValidationResult(
+                        status='rejected',
+                        error_code=final_error_code or 'poor_quality',
+                        reason='Документ не пройшов перевірку якості',
+                        ai_response=ai_response
+                    )
+                case (_, 'REJECTED'):
+                    return ValidationResult(
+                        status='rejected',
+                        error_code=final_error_code or 'wrong_document',
+                        reason='Невірний тип документа',
+                        ai_response=ai_response
+                    )
+                case (_, 'UNCERTAIN'):
+                    return ValidationResult(
+                        status='uncertain',
+                        error_code=final_error_code or 'uncertain',
+                        reason='Документ потребує ручної перевірки',
+                        ai_response=ai_response
+                    )
+                case (_, 'ACCEPTED'):
+                    return ValidationResult(
+                        status='accepted',
+                        error_code=None,
+                        reason='Документ прийнято',
+                        ai_response=ai_response
+                    )
 
-            logger.warning(f"Unknown document status: {doc_status}")
+            logger.warning(f"Unknown document status: {raw.doc_status}")
             return ValidationResult(
                 status='uncertain',
                 error_code='uncertain',
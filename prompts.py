@@ -100,7 +100,7 @@ DOCUMENT_PROMPTS = {
   "error_code": "код_помилки_з_переліку_вище" | null,
   "document_check": {
     "status": "ACCEPTED" | "REJECTED" | "UNCERTAIN",
-    "detected_documents": ["що саме виявлено"],
+    "detected_document": "що саме виявлено (напр. паспорт + ІПН)",
     "error_code": "код_помилки" | null
   }
 }
@@ -5,15 +5,31 @@ Google Sheets Sync - синхронізація даних клієнтів з P
 import os
 import json
 import logging
+import random
+import string
+import threading
 import time
+from bisect import bisect_left
 from datetime import datetime
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import NamedTupleCursor
+from psycopg2.pool import ThreadedConnectionPool
 
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.credentials import Credentials
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.model import JsonModel
+
+# orjson (Rust) швидший за stdlib json на великих відповідях Sheets API; stdlib — як fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
 
 # ============================================================================
 # КОНФІГУРАЦІЯ
@@ -27,6 +43,31 @@ GOOGLE_CREDENTIALS_FILE = os.getenv('GOOGLE_CREDENTIALS_FILE')
 
 SYNC_INTERVAL = int(os.getenv('SYNC_INTERVAL', 4 * 60 * 60))
 
+# Повтори запитів до Sheets API на 429 / 5xx (експоненційний backoff 1, 2, 4, 8... до 64 с + jitter)
+SHEETS_MAX_ATTEMPTS = int(os.getenv('SHEETS_MAX_ATTEMPTS', 5))
+SHEETS_RETRY_STATUSES = {429, 500, 503}
+
+# Таймаут HTTP-запитів до Sheets API (httplib2 за замовчуванням чекає безкінечно)
+SHEETS_HTTP_TIMEOUT = int(os.getenv('SHEETS_HTTP_TIMEOUT', 60))
+
+# Максимальний розмір тіла одного batchUpdate (ліміт API ~10 МБ, залишаємо запас)
+SHEETS_MAX_REQUEST_BYTES = 5 * 1024 * 1024
+
+# Скільки batchUpdate-запитів (частин великого оновлення) виконуються паралельно
+SHEETS_WRITE_WORKERS = int(os.getenv('SHEETS_WRITE_WORKERS', 4))
+
+# Скільки секунд телефони з таблиці вважаються актуальними (скидається після кожного запису)
+SHEETS_CACHE_TTL = float(os.getenv('SHEETS_CACHE_TTL', 60))
+
+# Індекс телефонів таблиці між синками (і перезапусками): використовується, поки не змінилась версія файлу
+# в Drive і колонка C (легке читання лише значень) збігається з ним рядок у рядок; інакше — повне читання.
+# Раз на SHEETS_INDEX_MAX_AGE секунд таблиця все одно читається повністю. Порожній шлях — без файлу.
+SHEETS_INDEX_CACHE_PATH = os.getenv(
+    'SHEETS_INDEX_CACHE_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'documents_bot', 'sheets_index.json')
+)
+SHEETS_INDEX_MAX_AGE = float(os.getenv('SHEETS_INDEX_MAX_AGE', 24 * 60 * 60))
+
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
@@ -59,47 +100,215 @@ COLUMNS = {
     'income_over_30k': 18,    # S
 }
 
-DOC_TYPES = ['passport', 'ecp', 'registration', 'family_income', 'credit_contracts',
-             'debt_certificates', 'expenses', 'bank_statements', 'workbook', 'story']
+DOC_TYPES = ('passport', 'ecp', 'registration', 'family_income', 'credit_contracts',
+             'debt_certificates', 'expenses', 'bank_statements', 'workbook', 'story')
+
+SCREENING_FIELDS = ('has_gambling_crypto', 'is_fraud_victim', 'has_sold_property', 'income_over_30k')
+
+# Чекбокси документів: doc_type -> біт; маска -> готовий вектор True/False у порядку DOC_TYPES
+_DOC_BITS = {doc: 1 << i for i, doc in enumerate(DOC_TYPES)}
+_BOOL_VECS = tuple(
+    tuple(bool(mask & (1 << i)) for i in range(len(DOC_TYPES)))
+    for mask in range(1 << len(DOC_TYPES))
+)
+_DOC_COLUMNS = tuple(COLUMNS[doc] for doc in DOC_TYPES)
 
-SCREENING_FIELDS = ['has_gambling_crypto', 'is_fraud_victim', 'has_sold_property', 'income_over_30k']
+# Порядок колонок A-S — новий рядок збирається конкатенацією в цьому порядку
+_ROW_LAYOUT = ('date', 'full_name', 'phone', 'telegram', 'folder_created') + DOC_TYPES + SCREENING_FIELDS
+assert tuple(sorted(COLUMNS, key=COLUMNS.get)) == _ROW_LAYOUT
+
+# Відображення скринінгу в таблиці: boolean -> Так/Ні, відсутнє значення -> ''
+SCREENING_TEXT = {True: 'Так', False: 'Ні'}
 
 FIRST_DATA_ROW = 2
 
+# Суцільний діапазон колонок, які оновлюються для існуючого клієнта:
+# телефон, telegram, папка, чекбокси, скринінг (C-S)
+DETAILS_FIRST_COL = COLUMNS['phone']
+DETAILS_LAST_COL = max(COLUMNS[f] for f in DOC_TYPES + SCREENING_FIELDS)
+# Повний рядок клієнта (A-S)
+ROW_WIDTH = max(COLUMNS.values()) + 1
+
+# Літери колонок A..Z, AA..ZZ (702 колонки)
+_COL_LETTERS = (
+    tuple(string.ascii_uppercase)
+    + tuple(a + b for a in string.ascii_uppercase for b in string.ascii_uppercase)
+)
+
 # ============================================================================
 # DATABASE
 # ============================================================================
 
+# Нормалізований телефон (як normalize_phone) — generated column + індекс. Виконує і бот
+# (telegram_bot.Database.create_phone_column), і синк при створенні пулу: хто б не стартував першим
+PHONE_E164_DDL = (
+    """
+    ALTER TABLE docbot.clients ADD COLUMN IF NOT EXISTS phone_e164 TEXT
+    GENERATED ALWAYS AS (
+        CASE
+            WHEN left(regexp_replace(phone, '[^0-9]', '', 'g'), 3) = '380' THEN regexp_replace(phone, '[^0-9]', '', 'g')
+            WHEN left(regexp_replace(phone, '[^0-9]', '', 'g'), 1) = '0' THEN '38' || regexp_replace(phone, '[^0-9]', '', 'g')
+            WHEN length(regexp_replace(phone, '[^0-9]', '', 'g')) = 10 THEN '380' || regexp_replace(phone, '[^0-9]', '', 'g')
+            ELSE regexp_replace(phone, '[^0-9]', '', 'g')
+        END
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_clients_phone_e164 ON docbot.clients (phone_e164)",
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """Пул з'єднань створюється один раз на процес (без handshake до Postgres на кожен синк)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # namedtuple замість dict на кожен рядок — дешевше створення і доступ по атрибуту
+                pool = ThreadedConnectionPool(1, 8, DATABASE_URL, cursor_factory=NamedTupleCursor)
+                _ensure_phone_column(pool)
+                _pool = pool
+                logger.info("Database pool created")
+    return _pool
+
+def _ensure_phone_column(pool):
+    """get_clients_by_phone читає phone_e164 — створюємо колонку, якщо синк запущено раніше за бота"""
+    conn = pool.getconn()
+    try:
+        with conn, conn.cursor() as cur:
+            for statement in PHONE_E164_DDL:
+                cur.execute(statement)
+    except psycopg2.Error as e:
+        # напр. немає прав на ALTER — якщо колонка вже є, синк працює і без цього
+        logger.warning(f"Could not ensure phone_e164 column: {e}")
+    finally:
+        pool.putconn(conn)
+
 class Database:
-    def __init__(self):
-        self.conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-        self.conn.autocommit = True
-        logger.info("Database connected")
+    """З'єднання з пулу на час блоку with"""
 
-    def get_all_clients_with_documents(self):
+    def __enter__(self):
+        pool = _get_pool()
+        self.conn = pool.getconn()
+        try:
+            # з'єднання могло прожити в пулі години — перевіряємо перед використанням
+            self.conn.autocommit = True
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT 1")
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            logger.warning(f"Pooled connection is dead ({e}), reconnecting...")
+            pool.putconn(self.conn, close=True)
+            self.conn = pool.getconn()
+            self.conn.autocommit = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _get_pool().putconn(self.conn, close=self.conn.closed != 0)
+        self.conn = None
+
+    def get_clients_by_phone(self):
+        """
+        Генератор клієнтів, згрупованих по нормалізованому телефону (phone_e164) на стороні БД:
+        документи об'єднуються, ім'я/telegram — від найновішого клієнта, папка і скринінг —
+        перше непорожнє значення (від новіших до старіших).
+        Server-side cursor, рядки приходять пачками по 1000 (без fetchall).
+        """
         query = """
-            SELECT
-                c.id, c.full_name, c.phone, c.telegram_id,
-                c.drive_folder_id, c.drive_folder_url, c.created_at,
-                c.has_gambling_crypto, c.is_fraud_victim,
-                c.has_sold_property, c.income_over_30k,
-                ARRAY_AGG(DISTINCT d.document_type) FILTER (WHERE d.document_type IS NOT NULL) as document_types
-            FROM docbot.clients c
-            LEFT JOIN docbot.documents d ON c.id = d.client_id
-            GROUP BY c.id
-            ORDER BY c.created_at DESC
+            WITH people AS (
+                SELECT
+                    c.phone_e164,
+                    COUNT(*) AS clients_count,
+                    (ARRAY_AGG(c.full_name ORDER BY c.created_at DESC))[1] AS full_name,
+                    (ARRAY_AGG(c.telegram_id ORDER BY c.created_at DESC))[1] AS telegram_id,
+                    MAX(c.created_at) AS created_at,
+                    (ARRAY_AGG(c.drive_folder_url ORDER BY c.created_at DESC)
+                        FILTER (WHERE c.drive_folder_url <> ''))[1] AS drive_folder_url,
+                    (ARRAY_AGG(c.has_gambling_crypto ORDER BY c.created_at DESC)
+                        FILTER (WHERE c.has_gambling_crypto IS NOT NULL))[1] AS has_gambling_crypto,
+                    (ARRAY_AGG(c.is_fraud_victim ORDER BY c.created_at DESC)
+                        FILTER (WHERE c.is_fraud_victim IS NOT NULL))[1] AS is_fraud_victim,
+                    (ARRAY_AGG(c.has_sold_property ORDER BY c.created_at DESC)
+                        FILTER (WHERE c.has_sold_property IS NOT NULL))[1] AS has_sold_property,
+                    (ARRAY_AGG(c.income_over_30k ORDER BY c.created_at DESC)
+                        FILTER (WHERE c.income_over_30k IS NOT NULL))[1] AS income_over_30k
+                FROM docbot.clients c
+                WHERE c.phone_e164 <> ''
+                GROUP BY c.phone_e164
+            ),
+            docs AS (
+                SELECT c.phone_e164, ARRAY_AGG(DISTINCT d.document_type) AS document_types
+                FROM docbot.documents d
+                JOIN docbot.clients c ON c.id = d.client_id
+                WHERE d.document_type IS NOT NULL AND c.phone_e164 <> ''
+                GROUP BY c.phone_e164
+            )
+            SELECT people.*, docs.document_types
+            FROM people
+            LEFT JOIN docs USING (phone_e164)
+            ORDER BY people.created_at DESC NULLS FIRST
         """
-        with self.conn.cursor() as cur:
+        # withhold=True — named cursor в autocommit-з'єднанні
+        with self.conn.cursor(name='clients_stream', withhold=True) as cur:
+            cur.itersize = 1000
             cur.execute(query)
-            return cur.fetchall()
-
-    def close(self):
-        self.conn.close()
+            yield from cur
 
 # ============================================================================
 # GOOGLE SHEETS
 # ============================================================================
 
+class _RateLimiter:
+    """Token bucket: не більше cap запитів підряд, далі — rate запитів/сек"""
+
+    def __init__(self, rate, cap):
+        self.rate = rate
+        self.cap = cap
+        self.tokens = float(cap)
+        self.last = time.monotonic()
+        # запити на запис можуть іти з кількох потоків
+        self._lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.cap, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < cost:
+                time.sleep((cost - self.tokens) / self.rate)
+                self.tokens = cost
+                self.last = time.monotonic()
+            self.tokens -= cost
+
+class _OrjsonModel(JsonModel):
+    """JsonModel для googleapiclient, що (де)серіалізує тіла через orjson"""
+
+    def serialize(self, body_value):
+        if self._data_wrapper and isinstance(body_value, dict) and 'data' not in body_value:
+            body_value = {'data': body_value}
+        return orjson.dumps(body_value).decode('utf-8')
+
+    def deserialize(self, content):
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return content.decode('utf-8') if isinstance(content, bytes) else content
+        if self._data_wrapper and isinstance(body, dict) and 'data' in body:
+            body = body['data']
+        return body
+
+def _range_first_row(a1_range, default):
+    """Номер першого рядка з A1-діапазону ("'Аркуш'!A12:S20" -> 12); default, якщо не розпізнано"""
+    cell = a1_range.rpartition('!')[2].partition(':')[0]
+    digits = cell.lstrip(string.ascii_letters)
+    return int(digits) if digits.isdigit() else default
+
+def _json_size(value):
+    """Розмір value у JSON (байти UTF-8)"""
+    if orjson is not None:
+        return len(orjson.dumps(value))
+    return len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
 class SheetsManager:
     def __init__(self):
         if GOOGLE_OAUTH_TOKEN:
@@ -124,70 +333,327 @@ class SheetsManager:
         else:
             raise ValueError("No Google credentials!")
 
-        self.service = build('sheets', 'v4', credentials=credentials)
+        self._credentials = credentials
+        # httplib2.Http не потокобезпечний — свій сервіс на кожен потік
+        self._local = threading.local()
         self.spreadsheet_id = GOOGLE_SPREADSHEET_ID
         self.sheet_name = GOOGLE_SHEET_NAME
+        # Властивості аркуша з останнього get_existing_rows (sheetId для ensure_checkboxes)
+        self._sheet_properties = None
+        # Кеш get_existing_rows: (monotonic час, first_rows, duplicate_rows, last_row)
+        self._rows_cache = None
+        # Індекс між синками: dict(version, saved_at, sheet_properties, first_rows, last_row) —
+        # див. remember_rows
+        self._index = None
+        # Валідацію чекбоксів ставимо один раз на процес
+        self._checkboxes_ready = False
+        # Квота Sheets API — 60 запитів на запис за хвилину
+        self._writes = _RateLimiter(rate=1.0, cap=60)
         logger.info(f"Sheets API initialized: {GOOGLE_SPREADSHEET_ID}")
 
-    def get_existing_phones(self):
-        """Отримати телефони з таблиці з відстеженням дублікатів"""
-        range_name = f"'{self.sheet_name}'!A:S"
-        result = self.service.spreadsheets().values().get(
-            spreadsheetId=self.spreadsheet_id,
-            range=range_name
-        ).execute()
+    @property
+    def service(self):
+        """
+        Sheets-клієнт поточного потоку. Один httplib2.Http на потік — keep-alive з'єднання (і TLS-сесія)
+        перевикористовуються між усіма запитами та синками
+        """
+        return self._client('sheets', 'v4')
+
+    def _client(self, name, version):
+        service = getattr(self._local, name, None)
+        if service is None:
+            http = AuthorizedHttp(self._credentials, http=httplib2.Http(timeout=SHEETS_HTTP_TIMEOUT))
+            # Discovery-документ з пакета (без HTTP-запиту); OAuth токен AuthorizedHttp оновлює сам на 401
+            model = _OrjsonModel() if orjson is not None else None
+            service = build(name, version, http=http, model=model,
+                            cache_discovery=False, static_discovery=True)
+            setattr(self._local, name, service)
+        return service
+
+    def _sheet_version(self):
+        """Версія файлу таблиці в Drive (змінюється при будь-якій правці) або None, якщо недоступна"""
+        try:
+            result = self._execute(self._client('drive', 'v3').files().get(
+                fileId=self.spreadsheet_id, fields='version', supportsAllDrives=True
+            ))
+            return result.get('version')
+        except Exception as e:
+            logger.warning(f"Could not get spreadsheet version: {e}")
+            return None
+
+    def _load_index(self):
+        if self._index is None and SHEETS_INDEX_CACHE_PATH:
+            try:
+                with open(SHEETS_INDEX_CACHE_PATH, 'rb') as f:
+                    index = orjson.loads(f.read()) if orjson is not None else json.load(f)
+            except FileNotFoundError:
+                return None
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable sheet index cache: {e}")
+                return None
+            if index.get('spreadsheet') == [self.spreadsheet_id, self.sheet_name] and 'first_rows' in index:
+                self._index = index
+        return self._index
+
+    def remember_rows(self, first_rows, last_row):
+        """
+        Запам'ятати індекс таблиці після власних записів синку (без дублікатів; формат — як у
+        get_existing_rows) разом з поточною версією файлу. Правка, що встигне між останнім записом і
+        читанням версії, не пройде звірку колонки C у get_existing_rows — тоді таблиця читається повністю.
+        """
+        version = self._sheet_version()
+        if version is None or self._sheet_properties is None:
+            return
+        self._index = {
+            'spreadsheet': [self.spreadsheet_id, self.sheet_name],
+            'version': version,
+            'saved_at': time.time(),
+            'sheet_properties': self._sheet_properties,
+            'first_rows': first_rows,
+            'last_row': last_row,
+        }
+        if not SHEETS_INDEX_CACHE_PATH:
+            return
+        try:
+            os.makedirs(os.path.dirname(SHEETS_INDEX_CACHE_PATH), exist_ok=True)
+            tmp_path = f"{SHEETS_INDEX_CACHE_PATH}.tmp"
+            with open(tmp_path, 'wb') as f:
+                if orjson is not None:
+                    f.write(orjson.dumps(self._index))
+                else:
+                    f.write(json.dumps(self._index, ensure_ascii=False).encode('utf-8'))
+            os.replace(tmp_path, SHEETS_INDEX_CACHE_PATH)
+        except OSError as e:
+            logger.warning(f"Could not save sheet index cache: {e}")
 
-        # normalized_phone -> list of row numbers (для виявлення дублікатів)
-        phones = defaultdict(list)
-        for i, row in enumerate(result.get('values', [])):
-            if i < FIRST_DATA_ROW - 1:
-                continue
-            # Колонка C (індекс 2) - телефон
-            if row and len(row) > 2:
-                phone = str(row[2]).strip() if row[2] else ''
-                if phone:
-                    norm = normalize_phone(phone)
-                    if norm:
-                        phones[norm].append(i + 1)
-        return dict(phones)
-
-    def ensure_rows(self, needed_rows):
-        """Розширити таблицю якщо потрібно"""
+    def get_existing_rows(self):
+        """
+        Отримати телефони з таблиці з відстеженням дублікатів.
+        Одним запитом читаємо тільки колонку C рядків з даними (неформатовані значення) + властивості аркуша.
+        Повертає (normalized_phone -> перший рядок, [рядки-дублікати], останній рядок з телефоном).
+        Кешується на SHEETS_CACHE_TTL секунд. Індекс з remember_rows використовується, поки версія файлу
+        в Drive не змінилась і телефони в колонці C стоять у тих самих рядках (_phone_column_matches).
+        """
+        if self._rows_cache is not None:
+            cached_at, first_rows, duplicate_rows, last_row = self._rows_cache
+            if time.monotonic() - cached_at < SHEETS_CACHE_TTL:
+                return dict(first_rows), list(duplicate_rows), last_row
+
+        # Ніхто не правив таблицю після останнього синку — індекс з remember_rows актуальний
+        version = self._sheet_version()
+        index = self._load_index()
+        if (version is not None and index is not None and index['version'] == version
+                and time.time() - index['saved_at'] < SHEETS_INDEX_MAX_AGE):
+            first_rows, last_row = index['first_rows'], index['last_row']
+            # версію могли прочитати вже після чужої правки — перед записом звіряємо самі телефони
+            if self._phone_column_matches(first_rows, last_row):
+                logger.info(f"Sheet unchanged since last sync (version {version}), using cached index")
+                self._sheet_properties = index['sheet_properties']
+                self._rows_cache = (time.monotonic(), first_rows, [], last_row)
+                return dict(first_rows), [], last_row
+            logger.info("Phone column differs from cached index, re-reading sheet")
+
+        result = self._execute(self.service.spreadsheets().get(
+            spreadsheetId=self.spreadsheet_id,
+            ranges=[f"'{self.sheet_name}'!C{FIRST_DATA_ROW}:C"],
+            includeGridData=True,
+            fields='sheets(properties(sheetId,title),'
+                   'data(startRow,rowData(values(effectiveValue))))'
+        ))
+
+        sheet = result['sheets'][0]
+        self._sheet_properties = sheet['properties']
+
+        first_rows, duplicate_rows, last_row = _scan_phones(
+            (i, _cell_text((row.get('values') or [{}])[0]))
+            for data in sheet.get('data', [])
+            for i, row in enumerate(data.get('rowData', []), start=data.get('startRow', 0) + 1)
+        )
+
+        self._rows_cache = (time.monotonic(), first_rows, duplicate_rows, last_row)
+        return dict(first_rows), list(duplicate_rows), last_row
+
+    def _phone_column_matches(self, first_rows, last_row):
+        """Колонка C (лише значення, без grid data) дає той самий індекс: ніхто не вставив, не видалив і не сортував рядки"""
+        result = self._execute(self.service.spreadsheets().values().get(
+            spreadsheetId=self.spreadsheet_id,
+            range=f"'{self.sheet_name}'!C{FIRST_DATA_ROW}:C",
+            valueRenderOption='UNFORMATTED_VALUE',
+            majorDimension='COLUMNS',
+            fields='values'
+        ))
+        column = (result.get('values') or [[]])[0]
+        scanned = _scan_phones(enumerate(map(_value_text, column), start=FIRST_DATA_ROW))
+        return scanned == (first_rows, [], last_row)
+
+    def ensure_checkboxes(self):
+        """Поставити колонкам документів (F-O) валідацію BOOLEAN — значення True/False рендеряться як чекбокси"""
+        if self._checkboxes_ready or self._sheet_properties is None:
+            return
+        doc_cols = [COLUMNS[doc] for doc in DOC_TYPES]
         try:
-            metadata = self.service.spreadsheets().get(
-                spreadsheetId=self.spreadsheet_id
-            ).execute()
-
-            for sheet in metadata.get('sheets', []):
-                if sheet['properties']['title'] == self.sheet_name:
-                    current = sheet['properties']['gridProperties']['rowCount']
-                    if needed_rows > current:
-                        to_add = needed_rows - current + 50
-                        self.service.spreadsheets().batchUpdate(
-                            spreadsheetId=self.spreadsheet_id,
-                            body={'requests': [{
-                                'appendDimension': {
-                                    'sheetId': sheet['properties']['sheetId'],
-                                    'dimension': 'ROWS',
-                                    'length': to_add
-                                }
-                            }]}
-                        ).execute()
-                        logger.info(f"Added {to_add} rows")
-                    return
+            self._writes.acquire()
+            self._execute(self.service.spreadsheets().batchUpdate(
+                spreadsheetId=self.spreadsheet_id,
+                body={'requests': [{
+                    'setDataValidation': {
+                        'range': {
+                            'sheetId': self._sheet_properties['sheetId'],
+                            'startRowIndex': FIRST_DATA_ROW - 1,
+                            'startColumnIndex': min(doc_cols),
+                            'endColumnIndex': max(doc_cols) + 1
+                        },
+                        'rule': {'condition': {'type': 'BOOLEAN'}}
+                    }
+                }]}
+            ))
+            self._checkboxes_ready = True
         except Exception as e:
-            logger.error(f"Error ensuring rows: {e}")
+            logger.error(f"Error setting checkbox validation: {e}")
+
+    def delete_rows(self, rows):
+        """
+        Видалити рядки (номери з 1) одним batchUpdate: сусідні рядки об'єднуються у відрізки,
+        відрізки видаляються знизу вгору, щоб не зсувати ще не видалені. Повертає кількість відрізків.
+        """
+        runs = []
+        for row in sorted(set(rows)):
+            if runs and row == runs[-1][1] + 1:
+                runs[-1][1] = row
+            else:
+                runs.append([row, row])
 
-    def batch_update(self, updates):
-        """Виконати batch update"""
+        self._writes.acquire()
+        self._rows_cache = None
+        self._execute(self.service.spreadsheets().batchUpdate(
+            spreadsheetId=self.spreadsheet_id,
+            body={'requests': [{
+                'deleteDimension': {
+                    'range': {
+                        'sheetId': self._sheet_properties['sheetId'],
+                        'dimension': 'ROWS',
+                        'startIndex': start - 1,
+                        'endIndex': end
+                    }
+                }
+            } for start, end in reversed(runs)]}
+        ))
+        return len(runs)
+
+    def batch_update(self, updates, value_input_option='USER_ENTERED'):
+        """
+        Виконати batch update. Ділимо на запити тільки коли тіло перевищує SHEETS_MAX_REQUEST_BYTES —
+        зазвичай це один запит на весь синк. Частини пишуть у різні діапазони, тому йдуть паралельно
+        (до SHEETS_WRITE_WORKERS, в межах квоти _writes).
+        RAW — для значень, які не треба парсити (очищення, тексти), USER_ENTERED — для дат/чисел.
+        """
         if not updates:
             return
-        self.service.spreadsheets().values().batchUpdate(
+        chunks = [[]]
+        chunk_bytes = 0
+        for update in updates:
+            size = _json_size(update)
+            if chunks[-1] and chunk_bytes + size > SHEETS_MAX_REQUEST_BYTES:
+                chunks.append([])
+                chunk_bytes = 0
+            chunks[-1].append(update)
+            chunk_bytes += size
+
+        if len(chunks) == 1:
+            self._batch_update_request(chunks[0], value_input_option)
+            return
+        with ThreadPoolExecutor(max_workers=min(SHEETS_WRITE_WORKERS, len(chunks))) as executor:
+            futures = [executor.submit(self._batch_update_request, chunk, value_input_option)
+                       for chunk in chunks]
+            for future in as_completed(futures):
+                future.result()
+
+    def _batch_update_request(self, updates, value_input_option):
+        self._writes.acquire()
+        self._rows_cache = None
+        self._execute(self.service.spreadsheets().values().batchUpdate(
             spreadsheetId=self.spreadsheet_id,
-            body={'valueInputOption': 'USER_ENTERED', 'data': updates}
-        ).execute()
+            body={'valueInputOption': value_input_option, 'data': updates}
+        ))
+
+    def _execute(self, request):
+        """
+        Виконати запит до Sheets API з повтором на 429 / 5xx / rateLimit.
+        Чекаємо Retry-After, якщо сервер його передав, інакше 2^attempt (до 64 с) + jitter.
+        Неретрайабельні помилки та вичерпані спроби — піднімаємо далі.
+        """
+        for attempt in range(SHEETS_MAX_ATTEMPTS):
+            try:
+                return request.execute()
+            except HttpError as e:
+                status = getattr(e.resp, 'status', None)
+                message = str(e)
+                retryable = (
+                    status in SHEETS_RETRY_STATUSES
+                    or 'rateLimit' in message
+                    or 'quota' in message.lower()
+                )
+                if not retryable or attempt == SHEETS_MAX_ATTEMPTS - 1:
+                    raise
+
+                retry_after = e.resp.get('retry-after') if e.resp is not None else None
+                try:
+                    delay = float(retry_after)
+                except (TypeError, ValueError):
+                    delay = min(64.0, 2 ** attempt) + random.uniform(0, 1)
+
+                logger.warning(f"Sheets API error {status}, retry {attempt + 1}/{SHEETS_MAX_ATTEMPTS - 1} "
+                               f"in {delay:.1f}s: {e}")
+                time.sleep(delay)
+
+    def append_rows(self, start_row, values):
+        """
+        Вставити рядки, починаючи з start_row. INSERT_ROWS сам розширює аркуш (без окремого
+        appendDimension) і нічого нижче не перезаписує. Зазвичай один запит; ділимо лише коли тіло
+        перевищує SHEETS_MAX_REQUEST_BYTES. Частини йдуть послідовно — кожна вставляється одразу
+        під попередньою, паралельні вставки в одне місце перемішали б порядок.
+        values.append сам шукає кінець таблиці і може вставити нижче start_row (під рядками без
+        телефону), тому фактичне місце кожної частини беремо з updatedRange відповіді.
+        Повертає ([(перший рядок, кількість рядків) для кожної частини по черзі], оновлені діапазони через кому).
+        """
+        self._rows_cache = None
+        # вставлені рядки — без валідації чекбоксів
+        self._checkboxes_ready = False
+        last_col = self._col_letter(ROW_WIDTH - 1)
+        updated_ranges = []
+        blocks = []
+        chunk, chunk_bytes = [], 0
+        for row in values:
+            size = _json_size(row)
+            if chunk and chunk_bytes + size > SHEETS_MAX_REQUEST_BYTES:
+                start_row = self._append_request(start_row, last_col, chunk, updated_ranges)
+                blocks.append((start_row, len(chunk)))
+                start_row += len(chunk)
+                chunk, chunk_bytes = [], 0
+            chunk.append(row)
+            chunk_bytes += size
+        if chunk:
+            start_row = self._append_request(start_row, last_col, chunk, updated_ranges)
+            blocks.append((start_row, len(chunk)))
+        return blocks, ', '.join(updated_ranges)
+
+    def _append_request(self, start_row, last_col, values, updated_ranges):
+        """Один values.append; повертає рядок, з якого реально вставлено values"""
+        self._writes.acquire()
+        result = self._execute(self.service.spreadsheets().values().append(
+            spreadsheetId=self.spreadsheet_id,
+            range=f"'{self.sheet_name}'!A{start_row}:{last_col}",
+            valueInputOption='USER_ENTERED',
+            insertDataOption='INSERT_ROWS',
+            body={'values': values}
+        ))
+        updated_range = result.get('updates', {}).get('updatedRange', '')
+        updated_ranges.append(updated_range)
+        return _range_first_row(updated_range, start_row)
 
     def _col_letter(self, idx):
+        if 0 <= idx < len(_COL_LETTERS):
+            return _COL_LETTERS[idx]
         result = ''
         while idx >= 0:
             result = chr(idx % 26 + ord('A')) + result
@@ -198,10 +664,21 @@ class SheetsManager:
 # SYNC
 # ============================================================================
 
+class _KeepDigits(dict):
+    """Таблиця для str.translate: цифри лишаються, все інше (включно з не-ASCII) видаляється"""
+
+    def __missing__(self, key):
+        return None
+
+_DIGITS_ONLY = _KeepDigits({ord(c): c for c in '0123456789'})
+
+# Нормалізація телефону; повторена в SQL для docbot.clients.phone_e164 (PHONE_E164_DDL)
+# Ті самі телефони з таблиці повторюються між синками — кешуємо (чиста функція від рядка)
+@lru_cache(maxsize=1 << 16)
 def normalize_phone(phone):
     if not phone:
         return ''
-    digits = ''.join(filter(str.isdigit, str(phone)))
+    digits = str(phone).translate(_DIGITS_ONLY)
     if digits.startswith('380'):
         return digits
     if digits.startswith('0'):
@@ -210,192 +687,248 @@ def normalize_phone(phone):
         return '380' + digits
     return digits
 
+def _cell_text(cell):
+    """
+    Неформатоване значення клітинки як текст. USER_ENTERED зберігає телефон як число,
+    а formattedValue залежить від формату колонки (напр. 3,80501E+11) — тому беремо effectiveValue.
+    """
+    value = cell.get('effectiveValue') or {}
+    if 'numberValue' in value:
+        return _value_text(value['numberValue'])
+    return str(value.get('stringValue', '')).strip()
+
+def _value_text(value):
+    """Значення з values.get (UNFORMATTED_VALUE) як текст — так само, як _cell_text"""
+    if isinstance(value, bool):
+        return ''
+    if isinstance(value, (int, float)):
+        return str(int(value)) if float(value).is_integer() else str(value)
+    return value.strip() if isinstance(value, str) else ''
+
+def _scan_phones(rows):
+    """
+    Один прохід по (номер рядка, текст з колонки C): перший рядок телефону — основний, наступні —
+    дублікати (на видалення). Повертає (normalized_phone -> рядок, [дублікати], останній рядок з телефоном)
+    """
+    first_rows = {}
+    duplicate_rows = []
+    last_row = FIRST_DATA_ROW - 1
+    for i, phone in rows:
+        norm = normalize_phone(phone) if phone else ''
+        if norm:
+            if norm in first_rows:
+                duplicate_rows.append(i)
+            else:
+                first_rows[norm] = i
+            last_row = i
+    return first_rows, duplicate_rows, last_row
+
+_NO_DOCS = frozenset()
+
+def group_clients_by_phone(rows):
+    """Зібрати вже згруповані в БД рядки в dict по телефону. Повертає (dict, кількість клієнтів)"""
+    clients_by_phone = {}
+    count = 0
+    for row in rows:
+        count += row.clients_count
+        document_types = row.document_types
+        clients_by_phone[row.phone_e164] = {
+            'full_name': row.full_name or '',
+            'telegram_id': row.telegram_id,
+            'created_at': row.created_at,
+            'drive_folder_url': row.drive_folder_url or '',
+            # документи тільки читаються; порожній frozenset — синглтон, без алокації для клієнтів без документів
+            'doc_types': frozenset(document_types) if document_types else _NO_DOCS,
+            'screening': {
+                field: value
+                for field, value in zip(SCREENING_FIELDS, (row.has_gambling_crypto, row.is_fraud_victim,
+                                                          row.has_sold_property, row.income_over_30k))
+                if value is not None
+            },
+        }
+    return clients_by_phone, count
+
+_sheets_manager = None
+_sheets_manager_lock = threading.Lock()
+
+def get_sheets_manager():
+    """Один SheetsManager на процес: credentials, discovery-клієнт і кеші живуть між синками"""
+    global _sheets_manager
+    if _sheets_manager is None:
+        # double-checked lock: без локу два потоки могли б одночасно побачити None і створити два менеджери
+        with _sheets_manager_lock:
+            if _sheets_manager is None:
+                _sheets_manager = SheetsManager()
+    return _sheets_manager
+
+def telegram_link(telegram_id):
+    return 'tg://user?id=' + str(telegram_id) if telegram_id else ''
+
+def date_text(value):
+    """Дата у форматі таблиці ДД.ММ.РРРР (без strftime і локалі)"""
+    return f"{value.day:02d}.{value.month:02d}.{value.year}"
+
+def doc_mask(doc_types):
+    """Бітова маска документів (індекс у _BOOL_VECS)"""
+    mask = 0
+    for doc in doc_types:
+        mask |= _DOC_BITS.get(doc, 0)
+    return mask
+
+def screening_display(screening):
+    """Скринінг для таблиці: boolean -> Так/Ні, відсутнє -> ''"""
+    return [SCREENING_TEXT.get(screening.get(f), '') for f in SCREENING_FIELDS]
+
+def new_client_row(phone_norm, data, default_date):
+    """Повний рядок A-S нового клієнта (текст + чекбокси + скринінг) одним виразом"""
+    created = data['created_at']
+    return [
+        date_text(created) if created else default_date,
+        data['full_name'],
+        phone_norm,
+        telegram_link(data['telegram_id']),
+        data['drive_folder_url'],
+        *_BOOL_VECS[doc_mask(data['doc_types'])],
+        *screening_display(data['screening']),
+    ]
+
+def fill_client_details(row, offset, folder_url, doc_types, screening_values):
+    """Заповнити в row папку, чекбокси і скринінг (row[0] відповідає колонці offset)"""
+    row[COLUMNS['folder_created'] - offset] = folder_url
+    for col, checked in zip(_DOC_COLUMNS, _BOOL_VECS[doc_mask(doc_types)]):
+        row[col - offset] = checked
+    for field, value in zip(SCREENING_FIELDS, screening_values):
+        row[COLUMNS[field] - offset] = value
+    return row
+
+def sheet_index_after_sync(kept_rows, appended_blocks, new_rows, deleted_rows):
+    """
+    Індекс таблиці після записів синку, без повторного читання. appended_blocks — [(перший рядок, кількість)]
+    частин new_rows по черзі, як їх вставив append (рядки з перших відповідей); кожна вставка зсуває
+    нижчі рядки вниз. Потім видалені дублікати (нижчі рядки зсуваються вгору).
+    Повертає (first_rows, last_row) у форматі get_existing_rows.
+    """
+    phones = dict(kept_rows)
+    offset = 0
+    for start, count in appended_blocks:
+        phones = {phone: row + count if row >= start else row for phone, row in phones.items()}
+        for row, values in enumerate(new_rows[offset:offset + count], start=start):
+            phones[values[COLUMNS['phone']]] = row
+        offset += count
+
+    if deleted_rows:
+        # номери дублікатів — з читання до вставок; вставки йдуть нижче останнього рядка з телефоном
+        deleted = sorted(set(deleted_rows))
+        phones = {phone: row - bisect_left(deleted, row) for phone, row in phones.items()}
+    return phones, max(phones.values(), default=FIRST_DATA_ROW - 1)
+
 def sync_to_sheets():
     """Головна функція - BATCH синхронізація з дедуплікацією"""
     logger.info("=" * 50)
     logger.info("Starting BATCH sync to Google Sheets...")
     start_time = datetime.now()
+    # Дата за замовчуванням для нових клієнтів без created_at — одна на весь синк
+    today_str = date_text(start_time)
 
     try:
-        db = Database()
-        sheets = SheetsManager()
-
-        # 1. Отримуємо дані з БД
-        clients = db.get_all_clients_with_documents()
-        logger.info(f"Found {len(clients)} clients in DB")
-
-        # 2. Групуємо клієнтів по нормалізованому телефону (об'єднуємо документи)
-        clients_by_phone = {}
-        for client in clients:
-            phone = client['phone']
-            if not phone:
-                continue
-            phone_norm = normalize_phone(phone)
-            if not phone_norm:
-                continue
-
-            doc_types = set(client.get('document_types') or [])
-
-            if phone_norm not in clients_by_phone:
-                screening = {}
-                for field in SCREENING_FIELDS:
-                    val = client.get(field)
-                    if val is not None:
-                        screening[field] = val
-                clients_by_phone[phone_norm] = {
-                    'full_name': client['full_name'] or '',
-                    'telegram_id': client.get('telegram_id'),
-                    'created_at': client['created_at'],
-                    'drive_folder_url': client.get('drive_folder_url') or '',
-                    'doc_types': doc_types,
-                    'screening': screening,
-                }
-            else:
-                # Об'єднуємо документи від різних клієнтів з тим самим телефоном
-                clients_by_phone[phone_norm]['doc_types'].update(doc_types)
-                # Використовуємо folder_url якщо у поточного його немає
-                if not clients_by_phone[phone_norm]['drive_folder_url'] and client.get('drive_folder_url'):
-                    clients_by_phone[phone_norm]['drive_folder_url'] = client['drive_folder_url']
-                # Заповнюємо скринінг якщо у попереднього не було
-                for field in SCREENING_FIELDS:
-                    val = client.get(field)
-                    if val is not None and field not in clients_by_phone[phone_norm]['screening']:
-                        clients_by_phone[phone_norm]['screening'][field] = val
-
+        sheets = get_sheets_manager()
+
+        # 1. Паралельно читаємо БД і телефони з таблиці (з відстеженням дублікатів) —
+        #    два незалежні IO-запити, кожен на своєму з'єднанні
+        with Database() as db, ThreadPoolExecutor(max_workers=2) as executor:
+            clients_future = executor.submit(group_clients_by_phone, db.get_clients_by_phone())
+            phones_future = executor.submit(sheets.get_existing_rows)
+            clients_by_phone, clients_count = clients_future.result()
+            normalized_existing, duplicate_rows, last_row = phones_future.result()
+        logger.info(f"Found {clients_count} clients in DB")
+
+        # 2. Клієнти групуються по телефону в БД і стрімляться (без повного списку в пам'яті)
         logger.info(f"Unique phones in DB: {len(clients_by_phone)}")
 
-        # 3. Отримуємо телефони з таблиці (з відстеженням дублікатів)
-        existing_phones = sheets.get_existing_phones()
-        logger.info(f"Found {len(existing_phones)} unique phones in sheet")
-
-        # 4. Обробляємо дублікати: залишаємо перший рядок, очищуємо решту
-        normalized_existing = {}
-        last_row = FIRST_DATA_ROW - 1
-        duplicate_clears = []
-        duplicates_found = 0
-
-        for phone_norm, rows in existing_phones.items():
-            # Зберігаємо перший рядок як основний
-            normalized_existing[phone_norm] = rows[0]
-            # Решта - дублікати, очищуємо їх
-            for dup_row in rows[1:]:
-                duplicate_clears.append({
-                    'range': f"'{sheets.sheet_name}'!A{dup_row}:Z{dup_row}",
-                    'values': [[''] * 26]
-                })
-                duplicates_found += 1
-            # Відстежуємо максимальний рядок
-            for r in rows:
-                if r > last_row:
-                    last_row = r
+        # 3. Телефони з таблиці (прочитані на кроці 1)
+        logger.info(f"Found {len(normalized_existing)} unique phones in sheet")
 
+        # 4. Дублікати: перший рядок телефону лишається, решта видаляється (крок 8)
+        duplicates_found = len(duplicate_rows)
         if duplicates_found:
-            logger.info(f"Found {duplicates_found} duplicate rows to clear")
+            logger.info(f"Found {duplicates_found} duplicate rows to delete")
 
         logger.info(f"Last row: {last_row}")
 
         # 5. Готуємо дані для batch update
         all_updates = []
-        new_rows = []
+        updated_clients = 0
+        details_range = (f"{sheets._col_letter(DETAILS_FIRST_COL)}{{row}}:"
+                         f"{sheets._col_letter(DETAILS_LAST_COL)}{{row}}")
+        # Без telegram_id у БД колонку D не чіпаємо: C окремо, E-S окремо
+        phone_range = f"{sheets._col_letter(COLUMNS['phone'])}{{row}}"
+        after_telegram = COLUMNS['telegram'] + 1
+        after_telegram_range = (f"{sheets._col_letter(after_telegram)}{{row}}:"
+                                f"{sheets._col_letter(DETAILS_LAST_COL)}{{row}}")
 
         for phone_norm, data in clients_by_phone.items():
-            doc_types = data['doc_types']
-            folder_url = data['drive_folder_url']
-
             existing_row = normalized_existing.get(phone_norm)
-
-            screening = data.get('screening', {})
-            screening_values = [screening.get(f, '') for f in SCREENING_FIELDS]
-            # Конвертуємо boolean в Так/Ні для таблиці
-            screening_display = []
-            for v in screening_values:
-                if v is True:
-                    screening_display.append('Так')
-                elif v is False:
-                    screening_display.append('Ні')
-                else:
-                    screening_display.append('')
-
-            if existing_row:
-                # Оновлюємо: телефон (нормалізований), папку, чекбокси, скринінг
-                all_updates.append({
-                    'range': f"'{sheets.sheet_name}'!C{existing_row}",
-                    'values': [[phone_norm]]
-                })
-                # Папка
+            if not existing_row:
+                continue
+            # Оновлюємо одним діапазоном C-S: телефон (нормалізований), telegram, папку,
+            # чекбокси (F-O), скринінг (P-S). Без telegram_id у БД — двома діапазонами в обхід D,
+            # щоб не затерти формулу чи посилання, які менеджер поставив вручну
+            details = fill_client_details(
+                [''] * (DETAILS_LAST_COL - DETAILS_FIRST_COL + 1), DETAILS_FIRST_COL,
+                data['drive_folder_url'], data['doc_types'], screening_display(data['screening'])
+            )
+            details[COLUMNS['phone'] - DETAILS_FIRST_COL] = phone_norm
+            telegram = telegram_link(data['telegram_id'])
+            if telegram:
+                details[COLUMNS['telegram'] - DETAILS_FIRST_COL] = telegram
                 all_updates.append({
-                    'range': f"'{sheets.sheet_name}'!E{existing_row}",
-                    'values': [[folder_url]]
+                    'range': f"'{sheets.sheet_name}'!{details_range.format(row=existing_row)}",
+                    'values': [details]
                 })
-                # Чекбокси (F-O)
-                checkboxes = [doc in doc_types for doc in DOC_TYPES]
+            else:
                 all_updates.append({
-                    'range': f"'{sheets.sheet_name}'!F{existing_row}:O{existing_row}",
-                    'values': [checkboxes]
+                    'range': f"'{sheets.sheet_name}'!{phone_range.format(row=existing_row)}",
+                    'values': [[phone_norm]]
                 })
-                # Скринінг (P-S)
                 all_updates.append({
-                    'range': f"'{sheets.sheet_name}'!P{existing_row}:S{existing_row}",
-                    'values': [screening_display]
+                    'range': f"'{sheets.sheet_name}'!{after_telegram_range.format(row=existing_row)}",
+                    'values': [details[after_telegram - DETAILS_FIRST_COL:]]
                 })
-            else:
-                # Новий клієнт
-                created = data['created_at']
-                date_str = created.strftime('%d.%m.%Y') if created else datetime.now().strftime('%d.%m.%Y')
-                telegram = f"tg://user?id={data['telegram_id']}" if data.get('telegram_id') else ''
-
-                row_data = [
-                    date_str,
-                    data['full_name'],
-                    phone_norm,
-                    telegram,
-                    folder_url
-                ]
-                # Чекбокси
-                for doc in DOC_TYPES:
-                    row_data.append(doc in doc_types)
-                # Скринінг
-                row_data.extend(screening_display)
-
-                new_rows.append(row_data)
-                normalized_existing[phone_norm] = last_row + len(new_rows)
-
-        # 6. Очищуємо дублікати
-        if duplicate_clears:
-            chunk_size = 100
-            for i in range(0, len(duplicate_clears), chunk_size):
-                chunk = duplicate_clears[i:i+chunk_size]
-                sheets.batch_update(chunk)
-            logger.info(f"Cleared {duplicates_found} duplicate rows")
-
-        # 7. Розширюємо таблицю якщо потрібно
-        total_rows_needed = last_row + len(new_rows)
-        sheets.ensure_rows(total_rows_needed)
-
-        # 8. Додаємо нові рядки одним запитом
-        if new_rows:
-            start_row = last_row + 1
-            end_row = last_row + len(new_rows)
-            sheets.service.spreadsheets().values().update(
-                spreadsheetId=sheets.spreadsheet_id,
-                range=f"'{sheets.sheet_name}'!A{start_row}:S{end_row}",
-                valueInputOption='USER_ENTERED',
-                body={'values': new_rows}
-            ).execute()
-            logger.info(f"Added {len(new_rows)} new clients (rows {start_row}-{end_row})")
-
-        # 9. Оновлюємо існуючі записи batch'ем
-        if all_updates:
-            chunk_size = 100
-            for i in range(0, len(all_updates), chunk_size):
-                chunk = all_updates[i:i+chunk_size]
-                sheets.batch_update(chunk)
-            logger.info(f"Updated {len(all_updates)//4} existing clients")
+            updated_clients += 1
+
+        # Нові клієнти — повні рядки, всі пишуться одним запитом
+        new_rows = [
+            new_client_row(phone_norm, data, today_str)
+            for phone_norm, data in clients_by_phone.items()
+            if phone_norm not in normalized_existing
+        ]
+
+        # 6-7. Нові рядки (одним запитом після останнього рядка з телефоном) і оновлення існуючих
+        #      пишуться паралельно: вставка нижче last_row не зсуває рядки, які оновлюються
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            update_future = executor.submit(sheets.batch_update, all_updates) if all_updates else None
+            appended_blocks = []
+            if new_rows:
+                appended_blocks, updated_range = sheets.append_rows(last_row + 1, new_rows)
+                logger.info(f"Added {len(new_rows)} new clients ({updated_range})")
+            sheets.ensure_checkboxes()
+            if update_future is not None:
+                update_future.result()
+                logger.info(f"Updated {updated_clients} existing clients")
+
+        # 8. Видаляємо дублікати — в самому кінці, бо видалення зсуває номери рядків
+        if duplicate_rows:
+            runs = sheets.delete_rows(duplicate_rows)
+            logger.info(f"Deleted {duplicates_found} duplicate rows ({runs} ranges)")
+
+        # 9. Індекс таблиці після синку — наступний синк не читатиме таблицю, якщо її ніхто не змінить
+        sheets.remember_rows(*sheet_index_after_sync(
+            normalized_existing, appended_blocks, new_rows, duplicate_rows
+        ))
 
         elapsed = (datetime.now() - start_time).total_seconds()
         logger.info(f"Sync completed in {elapsed:.1f}s: {len(new_rows)} added, "
-                     f"{len(all_updates)//4} updated, {duplicates_found} duplicates cleared")
-        db.close()
+                     f"{updated_clients} updated, {duplicates_found} duplicates deleted")
 
     except Exception as e:
         logger.error(f"Sync error: {e}", exc_info=True)
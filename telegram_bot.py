@@ -3,14 +3,17 @@ Telegram Bot для збору документів клієнтів
 Все в одному файлі
 """
 import os
+import asyncio
 import logging
 import tempfile
 import base64
 import json
+import time
 import pytz
 from datetime import datetime, timezone
+from functools import lru_cache
 from io import BytesIO
-from threading import Thread
+from threading import Thread, Lock, local as _thread_local
 from http.server import HTTPServer, BaseHTTPRequestHandler
 
 # Telegram
@@ -22,14 +25,23 @@ from telegram.ext import (
 
 # Database
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2 import sql
 
 # Google Drive
 from google.oauth2 import service_account
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
 
+# orjson (Rust) швидший за stdlib json; stdlib — як fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
 # AI Document Validator
 from ai_document_validator import validator as ai_validator
 
@@ -49,6 +61,13 @@ ADMIN_FILE = os.path.join(ADMIN_FILE_PATH, 'admins.txt') if os.path.exists(ADMIN
 
 # Database
 DATABASE_URL = os.getenv('DATABASE_URL')
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 2))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 10))
+# Скільки секунд рядок клієнта по telegram_id живе в пам'яті (0 — без кешу)
+CLIENT_CACHE_TTL = float(os.getenv('CLIENT_CACHE_TTL', 30))
+CLIENT_CACHE_SIZE = 10_000
+# Як часто (сек) скидати накопичені last_activity в БД
+ACTIVITY_FLUSH_INTERVAL = int(os.getenv('ACTIVITY_FLUSH_INTERVAL', 10))
 
 # Google Drive
 ROOT_FOLDER_ID = os.getenv('ROOT_FOLDER_ID')
@@ -56,6 +75,10 @@ GOOGLE_CREDENTIALS_FILE = os.getenv('GOOGLE_CREDENTIALS_FILE', 'credentials.json
 GOOGLE_CREDENTIALS_BASE64 = os.getenv('GOOGLE_CREDENTIALS_BASE64')
 DRIVE_OWNER_EMAIL = os.getenv('DRIVE_OWNER_EMAIL')  # Email владельца Drive (ваш Gmail)
 GOOGLE_OAUTH_TOKEN = os.getenv('GOOGLE_OAUTH_TOKEN')  # OAuth токен (JSON string)
+# Скільки знайдених/створених папок (name, parent) тримати в пам'яті — ID папок стабільні
+DRIVE_FOLDER_CACHE_SIZE = int(os.getenv('DRIVE_FOLDER_CACHE_SIZE', 4096))
+# Файли до цього розміру завантажуються одним multipart-запитом; більші — resumable (окремий запит на сесію)
+DRIVE_RESUMABLE_THRESHOLD = int(os.getenv('DRIVE_RESUMABLE_THRESHOLD', 5 * 1024 * 1024))
 
 # Settings
 REMINDER_DAYS = int(os.getenv('REMINDER_DAYS', 3))
@@ -209,7 +232,13 @@ DOCUMENT_TYPES = {
     }
 }
 
-REQUIRED_DOCUMENTS = [key for key, val in DOCUMENT_TYPES.items() if val.get('required', False)]
+# Порядок — для відображення; frozenset — для перевірок входження
+REQUIRED_DOCUMENTS = tuple(key for key, val in DOCUMENT_TYPES.items() if val.get('required', False))
+REQUIRED_DOCUMENT_SET = frozenset(REQUIRED_DOCUMENTS)
+OPTIONAL_DOCUMENTS = tuple(key for key in DOCUMENT_TYPES if key not in REQUIRED_DOCUMENT_SET)
+# doc_key -> (emoji, коротка назва) для чек-листів і кнопок; коротка назва, безпечна для імені файлу
+DOC_LABELS = {key: (val['emoji'], val.get('short', val['name'])) for key, val in DOCUMENT_TYPES.items()}
+DOC_FILE_NAMES = {key: short.replace('/', '_').replace('\\', '_') for key, (_, short) in DOC_LABELS.items()}
 
 # ============================================================================
 # ПИТАННЯ АНКЕТИ ДЕКЛАРАЦІЇ
@@ -322,6 +351,16 @@ DECLARATION_QUESTIONS = [
     }
 ]
 
+DECLARATION_QUESTION_KEYS = tuple(q['key'] for q in DECLARATION_QUESTIONS)
+
+# UPDATE для кожного поля анкети — ім'я колонки через sql.Identifier, готові запити один раз при імпорті
+_DECLARATION_UPDATE_QUERIES = {
+    key: sql.SQL("UPDATE docbot.declarations SET {} = %s WHERE client_id = %s AND attempt = %s").format(
+        sql.Identifier(key)
+    )
+    for key in DECLARATION_QUESTION_KEYS
+}
+
 # ============================================================================
 # LOGGING
 # ============================================================================
@@ -336,28 +375,51 @@ logger = logging.getLogger(__name__)
 # ADMIN FILE MANAGEMENT
 # ============================================================================
 
+# Розпарсений ADMIN_FILE: перечитується тільки коли змінились mtime/розмір файлу
+_admins_cache = {'stat': None, 'admins': frozenset()}
+
 def load_admins():
-    """Завантажити список адмінів з файлу"""
-    if not os.path.exists(ADMIN_FILE):
-        return set()
+    """Завантажити список адмінів з файлу (кешується до зміни файлу)"""
+    try:
+        st = os.stat(ADMIN_FILE)
+    except FileNotFoundError:
+        return frozenset()
+    except OSError as e:
+        logger.error(f"Error loading admins: {e}")
+        return frozenset()
+
+    stat_key = (st.st_mtime_ns, st.st_size)
+    if _admins_cache['stat'] == stat_key:
+        return _admins_cache['admins']
     try:
         with open(ADMIN_FILE, 'r') as f:
-            return {int(line.strip()) for line in f if line.strip()}
+            admins = frozenset(int(line.strip()) for line in f if line.strip())
     except Exception as e:
         logger.error(f"Error loading admins: {e}")
-        return set()
+        return frozenset()
+    _admins_cache['stat'] = stat_key
+    _admins_cache['admins'] = admins
+    return admins
 
 def save_admin(telegram_id):
-    """Додати адміна до файлу"""
+    """Додати адміна до файлу (дописується один рядок)"""
     admins = load_admins()
     if telegram_id not in admins:
-        admins.add(telegram_id)
         try:
-            with open(ADMIN_FILE, 'w') as f:
-                for admin_id in admins:
-                    f.write(f"{admin_id}\n")
+            with open(ADMIN_FILE, 'ab+') as f:
+                # файл міг бути відредагований вручну без перевода рядка в кінці
+                prefix = b''
+                if f.seek(0, os.SEEK_END) > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        prefix = b'\n'
+                f.write(prefix + f"{telegram_id}\n".encode())
+            # Оновлюємо кеш одразу — наступний load_admins не перечитуватиме файл, який ми самі дописали
+            if _admins_cache['admins'] is admins:
+                st = os.stat(ADMIN_FILE)
+                _admins_cache['stat'] = (st.st_mtime_ns, st.st_size)
+                _admins_cache['admins'] = admins | {telegram_id}
             logger.info(f"Admin {telegram_id} saved to file")
-            return True
         except Exception as e:
             logger.error(f"Error saving admin: {e}")
             return False
@@ -367,56 +429,66 @@ def save_admin(telegram_id):
 # БАЗА ДАНИХ (PostgreSQL)
 # ============================================================================
 
+def _json_text(value):
+    """JSON-рядок для JSONB-параметра"""
+    if orjson is not None:
+        return orjson.dumps(value).decode('utf-8')
+    return json.dumps(value, ensure_ascii=False)
+
 class Database:
     def __init__(self):
-        self.conn = None
-        self._connect()
-
-    def _connect(self):
+        # Пул з'єднань: кожен execute бере своє з'єднання, обірване — закривається і замінюється новим
         try:
-            if self.conn:
-                try:
-                    self.conn.close()
-                except:
-                    pass
-            self.conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-            self.conn.autocommit = True
-            logger.info("Database connection established")
+            self.pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DATABASE_URL, cursor_factory=RealDictCursor)
+            logger.info("Database connection pool established")
         except Exception as e:
-            logger.error(f"Failed to connect to database: {e}")
+            logger.error("Failed to connect to database: %s", e)
             raise
-
-    def _ensure_connection(self):
-        try:
-            if self.conn is None or self.conn.closed:
-                logger.warning("Database connection lost, reconnecting...")
-                self._connect()
-            else:
-                with self.conn.cursor() as cur:
-                    cur.execute("SELECT 1")
-        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
-            logger.warning(f"Database connection check failed: {e}, reconnecting...")
-            self._connect()
+        # client_id -> (monotonic час, рядок клієнта); telegram_id -> client_id
+        self._client_cache = {}
+        self._client_cache_ids = {}
+        # client_id -> час останньої активності, ще не записаний в БД (див. flush_last_activity)
+        self._activity_buffer = {}
 
     def execute(self, query, params=None, fetch=False):
+        def run(cur):
+            cur.execute(query, params or ())
+            if fetch:
+                return cur.fetchall() if cur.description else None
+            return cur.rowcount
+        return self._with_cursor(run)
+
+    def execute_many(self, query, rows, template=None):
+        """INSERT ... VALUES %s для всіх rows одним запитом (psycopg2.extras.execute_values)"""
+        if not rows:
+            return 0
+        def run(cur):
+            execute_values(cur, query, rows, template=template, page_size=len(rows))
+            return cur.rowcount
+        return self._with_cursor(run)
+
+    def _with_cursor(self, run):
+        """Виконати run(cursor) на з'єднанні з пулу з повтором на обірваному з'єднанні"""
         max_retries = 3
         for attempt in range(max_retries):
+            conn = self.pool.getconn()
             try:
-                self._ensure_connection()
-                with self.conn.cursor() as cur:
-                    cur.execute(query, params or ())
-                    if fetch:
-                        return cur.fetchall() if cur.description else None
-                    return cur.rowcount
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    return run(cur)
             except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
-                logger.error(f"Database error on attempt {attempt + 1}/{max_retries}: {e}")
-                if attempt < max_retries - 1:
-                    self._connect()
-                else:
+                # Без пінгу SELECT 1 перед запитом: обірване з'єднання видно по помилці самого запиту
+                logger.error("Database error on attempt %s/%s: %s", attempt + 1, max_retries, e)
+                self.pool.putconn(conn, close=True)
+                conn = None
+                if attempt == max_retries - 1:
                     raise
             except Exception as e:
-                logger.error(f"Database error: {e}")
+                logger.error("Database error: %s", e)
                 raise
+            finally:
+                if conn is not None:
+                    self.pool.putconn(conn)
 
     # Clients
     def create_client(self, telegram_id, full_name, phone):
@@ -430,12 +502,49 @@ class Database:
             RETURNING *
         """
         result = self.execute(query, (telegram_id, full_name, phone), fetch=True)
+        if result:
+            self.forget_client(result[0]['id'])
         return result[0] if result else None
 
+    def _cached_client(self, client_id):
+        cached = self._client_cache.get(client_id)
+        if cached is not None and time.monotonic() - cached[0] < CLIENT_CACHE_TTL:
+            return dict(cached[1])
+        return None
+
+    def _remember_client(self, client):
+        if CLIENT_CACHE_TTL <= 0:
+            return
+        if len(self._client_cache) >= CLIENT_CACHE_SIZE:
+            self._client_cache.clear()
+            self._client_cache_ids.clear()
+        self._client_cache[client['id']] = (time.monotonic(), dict(client))
+        if client.get('telegram_id'):
+            self._client_cache_ids[client['telegram_id']] = client['id']
+
     def get_client_by_telegram_id(self, telegram_id):
+        """
+        Клієнт по telegram_id. Знайдений рядок кешується на CLIENT_CACHE_TTL секунд (спільно з get_client_by_id)
+        і скидається методами update_* цього класу; last_activity в кешованому рядку може відставати на TTL.
+        """
+        client_id = self._client_cache_ids.get(telegram_id)
+        if client_id is not None:
+            client = self._cached_client(client_id)
+            if client is not None and client['telegram_id'] == telegram_id:
+                return client
+
         query = "SELECT * FROM docbot.clients WHERE telegram_id = %s"
         result = self.execute(query, (telegram_id,), fetch=True)
-        return result[0] if result else None
+        if not result:
+            return None
+        self._remember_client(result[0])
+        return result[0]
+
+    def forget_client(self, client_id):
+        """Скинути кешований рядок клієнта (після зміни в docbot.clients)"""
+        cached = self._client_cache.pop(client_id, None)
+        if cached is not None and self._client_cache_ids.get(cached[1].get('telegram_id')) == client_id:
+            del self._client_cache_ids[cached[1]['telegram_id']]
 
     def get_client_by_phone(self, phone):
         query = "SELECT * FROM docbot.clients WHERE phone = %s"
@@ -443,9 +552,16 @@ class Database:
         return result[0] if result else None
 
     def get_client_by_id(self, client_id):
+        client = self._cached_client(client_id)
+        if client is not None:
+            return client
+
         query = "SELECT * FROM docbot.clients WHERE id = %s"
         result = self.execute(query, (client_id,), fetch=True)
-        return result[0] if result else None
+        if not result:
+            return None
+        self._remember_client(result[0])
+        return result[0]
 
     def update_client_drive_folder(self, client_id, folder_id, folder_url):
         query = """
@@ -454,10 +570,14 @@ class Database:
             WHERE id = %s
         """
         self.execute(query, (folder_id, folder_url, client_id))
+        self._activity_buffer.pop(client_id, None)
+        self.forget_client(client_id)
 
     def update_client_status(self, client_id, status):
         query = "UPDATE docbot.clients SET status = %s, last_activity = CURRENT_TIMESTAMP WHERE id = %s"
         self.execute(query, (status, client_id))
+        self._activity_buffer.pop(client_id, None)
+        self.forget_client(client_id)
 
     def update_client_screening(self, client_id, has_gambling_crypto, is_fraud_victim, has_sold_property, income_over_30k):
         query = """
@@ -468,10 +588,30 @@ class Database:
             WHERE id = %s
         """
         self.execute(query, (has_gambling_crypto, is_fraud_victim, has_sold_property, income_over_30k, client_id))
+        self._activity_buffer.pop(client_id, None)
+        self.forget_client(client_id)
 
     def update_last_activity(self, client_id):
-        query = "UPDATE docbot.clients SET last_activity = CURRENT_TIMESTAMP WHERE id = %s"
-        self.execute(query, (client_id,))
+        """Запам'ятати активність клієнта; в БД потрапить при наступному flush_last_activity"""
+        self._activity_buffer[client_id] = datetime.now(timezone.utc)
+
+    def flush_last_activity(self):
+        """Записати накопичені last_activity одним UPDATE"""
+        if not self._activity_buffer:
+            return
+        pending, self._activity_buffer = self._activity_buffer, {}
+        query = """
+            UPDATE docbot.clients AS c SET last_activity = v.ts
+            FROM (VALUES %s) AS v(id, ts)
+            WHERE c.id = v.id
+        """
+        try:
+            self.execute_many(query, list(pending.items()), template="(%s, %s::timestamptz)")
+        except Exception:
+            # Повертаємо в буфер, не перетираючи свіжіші значення
+            for client_id, ts in pending.items():
+                self._activity_buffer.setdefault(client_id, ts)
+            raise
 
     # Documents
     def add_document(self, client_id, document_type, file_name, drive_file_id, drive_file_url, file_size, uploaded_by_admin_id=None):
@@ -483,9 +623,29 @@ class Database:
         result = self.execute(query, (client_id, document_type, file_name, drive_file_id, drive_file_url, file_size, uploaded_by_admin_id), fetch=True)
         return result[0]['id'] if result else None
 
+    def add_document_with_validation(self, client_id, document_type, file_name, drive_file_id, drive_file_url, file_size,
+                                     validation_status, ai_response, uploaded_by_admin_id=None):
+        """Документ + результат AI-валідації (documents + document_validations) одним запитом"""
+        query = """
+            WITH ins_doc AS (
+                INSERT INTO docbot.documents
+                (client_id, document_type, file_name, drive_file_id, drive_file_url, file_size, uploaded_by_admin_id, validation_status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            )
+            INSERT INTO docbot.document_validations (document_id, validation_status, ai_response, validated_at)
+            SELECT id, %s, %s, CURRENT_TIMESTAMP FROM ins_doc
+            RETURNING document_id
+        """
+        result = self.execute(query, (
+            client_id, document_type, file_name, drive_file_id, drive_file_url, file_size, uploaded_by_admin_id, validation_status,
+            validation_status, _json_text(ai_response) if ai_response else None
+        ), fetch=True)
+        return result[0]['document_id'] if result else None
+
     def get_uploaded_types(self, client_id):
         query = """
-            SELECT DISTINCT document_type, COUNT(*) as count
+            SELECT document_type, COUNT(*) as count
             FROM docbot.documents
             WHERE client_id = %s
             GROUP BY document_type
@@ -493,6 +653,29 @@ class Database:
         result = self.execute(query, (client_id,), fetch=True)
         return {row['document_type']: row['count'] for row in result} if result else {}
 
+    def get_client_checklist_state(self, client_id):
+        """
+        Стан чек-листа одним запитом: (uploaded_types, has_ecpass, declaration_status)
+        — те саме, що get_uploaded_types + get_ec_password + get_declaration()['status']
+        """
+        query = """
+            SELECT
+                (SELECT COALESCE(json_object_agg(document_type, count), '{}'::json)
+                 FROM (
+                     SELECT document_type, COUNT(*) AS count
+                     FROM docbot.documents
+                     -- json_object_agg падає на NULL-ключі ("field name must not be null")
+                     WHERE client_id = %(client_id)s AND document_type IS NOT NULL
+                     GROUP BY document_type
+                 ) d) AS uploaded_types,
+                EXISTS (SELECT 1 FROM docbot.ec_passwords WHERE client_id = %(client_id)s) AS has_ecpass,
+                (SELECT status FROM docbot.declarations
+                 WHERE client_id = %(client_id)s
+                 ORDER BY attempt DESC LIMIT 1) AS declaration_status
+        """
+        row = self.execute(query, {'client_id': client_id}, fetch=True)[0]
+        return row['uploaded_types'], row['has_ecpass'], row['declaration_status']
+
     def get_documents_by_client(self, client_id):
         query = "SELECT * FROM docbot.documents WHERE client_id = %s ORDER BY uploaded_at DESC"
         return self.execute(query, (client_id,), fetch=True)
@@ -519,34 +702,41 @@ class Database:
         query = "INSERT INTO docbot.notifications_log (client_id, notification_type, message, admin_telegram_id) VALUES (%s, %s, %s, %s)"
         self.execute(query, (client_id, notification_type, message, admin_telegram_id))
 
+    def log_notifications(self, rows):
+        """Записати пачку [(client_id, notification_type, message, admin_telegram_id), ...] одним INSERT"""
+        query = "INSERT INTO docbot.notifications_log (client_id, notification_type, message, admin_telegram_id) VALUES %s"
+        self.execute_many(query, rows)
+
     def get_inactive_clients(self):
-        """Получить клиентов неактивных 3+ дня"""
-        query = """
-            SELECT * FROM docbot.clients
-            WHERE status = 'in_progress'
-            AND (NOW() AT TIME ZONE 'UTC' - last_activity) >= INTERVAL '3 days'
         """
-        return self.execute(query, fetch=True)
-
-    # Reminders
-    def log_reminder(self, client_id, days_inactive):
-        """Записати відправлене нагадування"""
-        query = """
-            INSERT INTO docbot.reminders_log (client_id, days_inactive, sent_at)
-            VALUES (%s, %s, CURRENT_TIMESTAMP)
+        Получить клиентов неактивных 3+ дня разом з часом останнього нагадування (last_reminder_at)
+        і кількістю завантажених обов'язкових документів (required_uploaded, пароль ЕЦП рахується як 'ecpass')
         """
-        self.execute(query, (client_id, days_inactive))
-
-    def get_last_reminder(self, client_id):
-        """Отримати останнє нагадування для клієнта"""
         query = """
-            SELECT * FROM docbot.reminders_log
-            WHERE client_id = %s
-            ORDER BY sent_at DESC
-            LIMIT 1
+            SELECT c.*, r.sent_at AS last_reminder_at,
+                (SELECT COUNT(*) FROM (
+                    SELECT document_type FROM docbot.documents WHERE client_id = c.id
+                    UNION
+                    SELECT 'ecpass' FROM docbot.ec_passwords WHERE client_id = c.id
+                ) t WHERE t.document_type = ANY(%(required)s)) AS required_uploaded
+            FROM docbot.clients c
+            LEFT JOIN LATERAL (
+                SELECT sent_at FROM docbot.reminders_log
+                WHERE client_id = c.id
+                ORDER BY sent_at DESC
+                LIMIT 1
+            ) r ON true
+            WHERE c.status = 'in_progress'
+            AND (NOW() AT TIME ZONE 'UTC' - c.last_activity) >= INTERVAL '3 days'
         """
-        result = self.execute(query, (client_id,), fetch=True)
-        return result[0] if result else None
+        self.flush_last_activity()
+        return self.execute(query, {'required': list(REQUIRED_DOCUMENTS)}, fetch=True)
+
+    # Reminders
+    def log_reminders(self, rows):
+        """Записати пачку нагадувань [(client_id, days_inactive), ...] одним INSERT"""
+        query = "INSERT INTO docbot.reminders_log (client_id, days_inactive, sent_at) VALUES %s"
+        self.execute_many(query, rows, template="(%s, %s, CURRENT_TIMESTAMP)")
 
     def create_reminders_table(self):
         """Створити таблицю для логування нагадувань"""
@@ -559,6 +749,10 @@ class Database:
             )
         """
         self.execute(query)
+        # Останнє нагадування клієнта (LATERAL у get_inactive_clients) — одним index scan
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS idx_reminders_log_client_sent ON docbot.reminders_log (client_id, sent_at DESC)"
+        )
 
     # -------------------------------------------------------------------------
     # Post-plan / CRM stage tables
@@ -589,11 +783,25 @@ class Database:
             except Exception:
                 pass
 
+    def create_phone_column(self):
+        """Нормалізований телефон (як sync_to_sheets.normalize_phone) — generated column + індекс"""
+        # DDL спільний із sync_to_sheets: синк може стартувати раніше за бота
+        from sync_to_sheets import PHONE_E164_DDL
+        for statement in PHONE_E164_DDL:
+            self.execute(statement)
+
+    def create_document_indexes(self):
+        """Індекс (client_id, document_type) — get_uploaded_types рахується index-only scan'ом"""
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS idx_documents_client_type ON docbot.documents (client_id, document_type)"
+        )
+
     def update_crm_stage(self, client_id, stage):
         self.execute(
             "UPDATE docbot.clients SET crm_stage = %s WHERE id = %s",
             (stage, client_id)
         )
+        self.forget_client(client_id)
 
     def get_all_registered_clients(self):
         """Всі клієнти з телефоном для перевірки CRM"""
@@ -614,12 +822,14 @@ class Database:
             "UPDATE docbot.clients SET plan_file_id = %s, plan_file_url = %s WHERE id = %s",
             (file_id, file_url, client_id)
         )
+        self.forget_client(client_id)
 
     def update_plan_folder(self, client_id, folder_id):
         self.execute(
             "UPDATE docbot.clients SET plan_folder_id = %s WHERE id = %s",
             (folder_id, client_id)
         )
+        self.forget_client(client_id)
 
     def add_plan_payment(self, client_id, file_name, file_url):
         self.execute(
@@ -629,14 +839,25 @@ class Database:
 
     # Declarations
     def get_or_create_declaration(self, client_id, attempt=1):
-        """Отримати існуючу декларацію або створити нову"""
-        query = "SELECT * FROM docbot.declarations WHERE client_id = %s AND attempt = %s"
-        result = self.execute(query, (client_id, attempt), fetch=True)
-        if result:
-            return result[0]
-
-        query = "INSERT INTO docbot.declarations (client_id, attempt) VALUES (%s, %s) RETURNING *"
-        result = self.execute(query, (client_id, attempt), fetch=True)
+        """Отримати існуючу декларацію або створити нову (один запит до БД)"""
+        # ON CONFLICT потребує унікального індексу (client_id, attempt), якого в схемі може не бути,
+        # тому SELECT і INSERT об'єднані в одному CTE
+        query = """
+            WITH existing AS (
+                SELECT * FROM docbot.declarations
+                WHERE client_id = %(client_id)s AND attempt = %(attempt)s
+                LIMIT 1
+            ), inserted AS (
+                INSERT INTO docbot.declarations (client_id, attempt)
+                SELECT %(client_id)s, %(attempt)s
+                WHERE NOT EXISTS (SELECT 1 FROM existing)
+                RETURNING *
+            )
+            SELECT * FROM existing
+            UNION ALL
+            SELECT * FROM inserted
+        """
+        result = self.execute(query, {'client_id': client_id, 'attempt': attempt}, fetch=True)
         return result[0] if result else None
 
     def get_declaration_by_attempt(self, client_id, attempt):
@@ -655,10 +876,13 @@ class Database:
         """Оновити статус бонусу клієнта"""
         query = "UPDATE docbot.clients SET bonus_earned = %s WHERE id = %s"
         self.execute(query, (value, client_id))
+        self.forget_client(client_id)
 
     def update_declaration_answer(self, client_id, field_name, answer, attempt=1):
-        """Оновити відповідь на питання в декларації"""
-        query = f"UPDATE docbot.declarations SET {field_name} = %s WHERE client_id = %s AND attempt = %s"
+        """Оновити відповідь на питання в декларації (field_name — тільки ключ з DECLARATION_QUESTIONS)"""
+        query = _DECLARATION_UPDATE_QUERIES.get(field_name)
+        if query is None:
+            raise ValueError(f"Unknown declaration field: {field_name}")
         self.execute(query, (answer, client_id, attempt))
 
     def complete_declaration(self, client_id, attempt=1):
@@ -673,36 +897,12 @@ class Database:
         return result[0] if result else None
 
     # Document Validations (AI)
-    def save_document_validation(self, document_id, validation_status, ai_response):
-        """Зберегти результат AI-валідації документа"""
-        query = """
-            INSERT INTO docbot.document_validations
-            (document_id, validation_status, ai_response, validated_at)
-            VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-            RETURNING id
-        """
-        result = self.execute(
-            query,
-            (document_id, validation_status, json.dumps(ai_response) if ai_response else None),
-            fetch=True
-        )
-        return result[0]['id'] if result else None
-
     def get_document_validation(self, document_id):
         """Отримати результат валідації документа"""
         query = "SELECT * FROM docbot.document_validations WHERE document_id = %s ORDER BY validated_at DESC LIMIT 1"
         result = self.execute(query, (document_id,), fetch=True)
         return result[0] if result else None
 
-    def update_document_validation_status(self, document_id, validation_status):
-        """Оновити статус валідації документа"""
-        query = """
-            UPDATE docbot.documents
-            SET validation_status = %s
-            WHERE id = %s
-        """
-        self.execute(query, (validation_status, document_id))
-
     def get_uncertain_documents(self):
         """Отримати всі документи зі статусом UNCERTAIN що потребують ручної перевірки"""
         query = """
@@ -718,6 +918,13 @@ class Database:
 # GOOGLE DRIVE
 # ============================================================================
 
+def _drive_q(value):
+    """Рядковий літерал для q-запиту Drive API (екранування \\ і ')"""
+    return "'" + str(value).replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+# Символи, заборонені в іменах папок/файлів (включно з керуючими \x00-\x1F) -> пробіл
+_FORBIDDEN_NAME_CHARS = str.maketrans({**{c: ' ' for c in '<>:"/\\|?*'}, **{chr(i): ' ' for i in range(0x20)}})
+
 class DriveManager:
     def __init__(self):
         try:
@@ -742,17 +949,39 @@ class DriveManager:
                     scopes=['https://www.googleapis.com/auth/drive']
                 )
             else:
-                logger.info(f"Using Service Account credentials file: {GOOGLE_CREDENTIALS_FILE}")
+                logger.info("Using Service Account credentials file: %s", GOOGLE_CREDENTIALS_FILE)
                 credentials = service_account.Credentials.from_service_account_file(
                     GOOGLE_CREDENTIALS_FILE,
                     scopes=['https://www.googleapis.com/auth/drive']
                 )
-            self.service = build('drive', 'v3', credentials=credentials)
+            self._credentials = credentials
+            self._local = _thread_local()
+            self.service  # перевіряємо, що клієнт будується, ще при старті
+            # (name, parent_id) / ('by_phone', phone, root) -> папка; тільки знайдені або створені, без негативних
+            self._folder_cache = {}
+            # Drive-виклики йдуть з кількох to_thread-потоків — читання і FIFO-витіснення під локом
+            self._folder_cache_lock = Lock()
+            # Фіксований набір локів, вибір по hash(phone): паралельні завантаження одного клієнта не
+            # повинні створити дві папки, а кількість локів не росте з кількістю клієнтів
+            self._structure_locks = tuple(Lock() for _ in range(64))
             logger.info("Google Drive API initialized successfully")
         except Exception as e:
-            logger.error(f"Failed to initialize Google Drive API: {e}")
+            logger.error("Failed to initialize Google Drive API: %s", e)
             raise
 
+    @property
+    def service(self):
+        """
+        Drive-клієнт поточного потоку: httplib2.Http не потокобезпечний, а виклики Drive йдуть через
+        asyncio.to_thread. Discovery-документ з пакета (без HTTP-запиту), keep-alive в межах потоку
+        """
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = build('drive', 'v3', credentials=self._credentials,
+                            cache_discovery=False, static_discovery=True)
+            self._local.service = service
+        return service
+
     def create_folder(self, name, parent_id=None):
         file_metadata = {
             'name': name,
@@ -765,17 +994,40 @@ class DriveManager:
             body=file_metadata,
             fields='id, webViewLink'
         ).execute()
-        logger.info(f"Created folder: {name}")
+        logger.info("Created folder: %s", name)
+        self._remember_folder((name, parent_id), folder)
         return folder
 
+    def _remember_folder(self, key, folder):
+        with self._folder_cache_lock:
+            if key not in self._folder_cache and len(self._folder_cache) >= DRIVE_FOLDER_CACHE_SIZE:
+                # найстаріший запис (dict зберігає порядок вставки)
+                del self._folder_cache[next(iter(self._folder_cache))]
+            self._folder_cache[key] = folder
+
+    def _cached_folder(self, key):
+        with self._folder_cache_lock:
+            return self._folder_cache.get(key)
+
+    def _forget_folder(self, key):
+        with self._folder_cache_lock:
+            self._folder_cache.pop(key, None)
+
     def find_folder_by_name(self, name, parent_id=None):
-        query = f"name='{name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
+        cached = self._cached_folder((name, parent_id))
+        if cached is not None:
+            return cached
+
+        query = f"name={_drive_q(name)} and mimeType='application/vnd.google-apps.folder' and trashed=false"
         if parent_id:
-            query += f" and '{parent_id}' in parents"
+            query += f" and {_drive_q(parent_id)} in parents"
 
         results = self.service.files().list(q=query, spaces='drive', fields='files(id, name, webViewLink)').execute()
         items = results.get('files', [])
-        return items[0] if items else None
+        if not items:
+            return None
+        self._remember_folder((name, parent_id), items[0])
+        return items[0]
 
     def get_or_create_folder(self, name, parent_id=None):
         folder = self.find_folder_by_name(name, parent_id)
@@ -783,64 +1035,146 @@ class DriveManager:
             return folder
         return self.create_folder(name, parent_id)
 
-    def create_client_folder_structure(self, full_name, phone):
-        safe_name = self._sanitize_name(full_name)
-        folder_name = f"{safe_name} | {phone}"
+    def create_client_folder_structure(self, full_name, phone, folder_id=None):
+        """
+        Папка клієнта і її підпапки. folder_id — вже відома папка клієнта (clients.drive_folder_id):
+        вона перевіряється одним files().get (далі з кешу) замість пошуку по назві/телефону.
+        Якщо папку видалено або перенесено в кошик — звичайний пошук, як без folder_id
+        """
+        with self._structure_locks[hash(phone) % len(self._structure_locks)]:
+            safe_name = self._sanitize_name(full_name)
+            folder_name = f"{safe_name} | {phone}"
 
-        # Пошук існуючої папки
-        existing = self._find_client_folder_by_phone(phone)
+            existing = self._get_folder_by_id(folder_id) if folder_id else None
+            if folder_id and existing is None:
+                logger.warning("Stored client folder %s is gone, looking up by name/phone", folder_id)
+            try:
+                return self._build_client_folders(folder_name, phone, existing)
+            except HttpError as e:
+                # збережена в кеші папка зникла між викликами — підпапки не створити
+                if existing is None or getattr(e.resp, 'status', None) != 404:
+                    raise
+                logger.warning("Client folder %s is gone (%s), looking up by name/phone", folder_id, e)
+                for key in (('by_id', folder_id), (folder_name, ROOT_FOLDER_ID), ('by_phone', phone, ROOT_FOLDER_ID)):
+                    self._forget_folder(key)
+                return self._build_client_folders(folder_name, phone, None)
+
+    def _build_client_folders(self, folder_name, phone, existing):
+        # Пошук існуючої папки: спершу точна назва (індексований пошук), потім — по телефону
+        # (клієнт міг змінити ім'я або папку перейменували вручну)
+        if existing is None:
+            existing = self.find_folder_by_name(folder_name, ROOT_FOLDER_ID) or self._find_client_folder_by_phone(phone)
         if existing:
-            logger.info(f"Client folder already exists: {existing['name']}")
+            logger.info("Client folder already exists: %s", existing['name'])
             client_folder = existing
         else:
             client_folder = self.create_folder(folder_name, ROOT_FOLDER_ID)
+            client_folder.setdefault('name', folder_name)
+            self._remember_folder(('by_phone', phone, ROOT_FOLDER_ID), client_folder)
 
         # Створюємо всі підпапки (або знаходимо існуючі)
-        credit_folder = self.get_or_create_folder(SUBFOLDERS['credit'], client_folder['id'])
-        personal_folder = self.get_or_create_folder(SUBFOLDERS['personal'], client_folder['id'])
-        declaration_folder = self.get_or_create_folder(SUBFOLDERS['declaration'], client_folder['id'])
-        expenses_folder = self.get_or_create_folder(SUBFOLDERS['expenses_confirmation'], client_folder['id'])
-        debt_folder = self.get_or_create_folder(SUBFOLDERS['debt_confirmation'], client_folder['id'])
-        additional_folder = self.get_or_create_folder(SUBFOLDERS['additional'], client_folder['id'])
-
-        return {
-            'client': client_folder,
-            'credit': credit_folder,
-            'personal': personal_folder,
-            'declaration': declaration_folder,
-            'expenses_confirmation': expenses_folder,
-            'debt_confirmation': debt_folder,
-            'additional': additional_folder
-        }
+        subfolders = self._get_or_create_subfolders(SUBFOLDERS.values(), client_folder['id'])
+
+        folders = {key: subfolders[name] for key, name in SUBFOLDERS.items()}
+        folders['client'] = client_folder
+        return folders
+
+    def _get_folder_by_id(self, folder_id):
+        """Папка за id (id, name, webViewLink) або None, якщо її видалено чи перенесено в кошик"""
+        cached = self._cached_folder(('by_id', folder_id))
+        if cached is not None:
+            return cached
+
+        try:
+            folder = self.service.files().get(fileId=folder_id, fields='id, name, webViewLink, trashed').execute()
+        except HttpError as e:
+            if getattr(e.resp, 'status', None) == 404:
+                return None
+            raise
+        if folder.pop('trashed', False):
+            return None
+        self._remember_folder(('by_id', folder_id), folder)
+        return folder
+
+    def _get_or_create_subfolders(self, names, parent_id):
+        """
+        Те саме, що get_or_create_folder для кожної назви, але за 2 запити замість 2 на папку:
+        існуючі підпапки — одним files().list по parent_id, відсутні — одним batch-запитом на створення
+        """
+        found = {name: self._cached_folder((name, parent_id)) for name in names}
+        if all(found.values()):
+            return found
+
+        query = f"{_drive_q(parent_id)} in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
+        results = self.service.files().list(
+            q=query, spaces='drive', fields='files(id, name, webViewLink)', pageSize=1000
+        ).execute()
+        for item in results.get('files', []):
+            if item['name'] in found and found[item['name']] is None:
+                found[item['name']] = item
+                self._remember_folder((item['name'], parent_id), item)
+
+        missing = [name for name, folder in found.items() if folder is None]
+        if not missing:
+            return found
+
+        errors = []
+
+        def on_created(request_id, response, exception):
+            name = missing[int(request_id)]
+            if exception is not None:
+                errors.append(exception)
+                return
+            logger.info("Created folder: %s", name)
+            found[name] = response
+            self._remember_folder((name, parent_id), response)
+
+        batch = self.service.new_batch_http_request(callback=on_created)
+        for i, name in enumerate(missing):
+            batch.add(self.service.files().create(
+                body={'name': name, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [parent_id]},
+                fields='id, webViewLink'
+            ), request_id=str(i))
+        batch.execute()
+        if errors:
+            raise errors[0]
+        return found
 
     def _find_client_folder_by_phone(self, phone):
-        query = f"name contains '{phone}' and mimeType='application/vnd.google-apps.folder' and '{ROOT_FOLDER_ID}' in parents and trashed=false"
+        cached = self._cached_folder(('by_phone', phone, ROOT_FOLDER_ID))
+        if cached is not None:
+            return cached
+
+        query = f"name contains {_drive_q(phone)} and mimeType='application/vnd.google-apps.folder' and {_drive_q(ROOT_FOLDER_ID)} in parents and trashed=false"
         results = self.service.files().list(q=query, spaces='drive', fields='files(id, name, webViewLink)').execute()
         items = results.get('files', [])
-        return items[0] if items else None
+        if not items:
+            return None
+        self._remember_folder(('by_phone', phone, ROOT_FOLDER_ID), items[0])
+        return items[0]
 
     def upload_file(self, file_path, folder_id, original_filename=None):
         filename = original_filename or os.path.basename(file_path)
         file_metadata = {'name': filename, 'parents': [folder_id]}
-        media = MediaFileUpload(file_path, resumable=True)
+        media = MediaFileUpload(file_path, resumable=os.path.getsize(file_path) > DRIVE_RESUMABLE_THRESHOLD)
         file = self.service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id, name, webViewLink, size'
         ).execute()
-        logger.info(f"Uploaded file: {filename}")
+        logger.info("Uploaded file: %s", filename)
         return file
 
     def upload_bytes(self, data: bytes, filename: str, folder_id: str, mimetype: str = 'application/octet-stream'):
         """Завантаження файлу з байтів (для квитанцій/плану з Telegram)"""
         file_metadata = {'name': filename, 'parents': [folder_id]}
-        media = MediaIoBaseUpload(BytesIO(data), mimetype=mimetype, resumable=True)
+        media = MediaIoBaseUpload(BytesIO(data), mimetype=mimetype, resumable=len(data) > DRIVE_RESUMABLE_THRESHOLD)
         file = self.service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id, name, webViewLink, size'
         ).execute()
-        logger.info(f"Uploaded bytes: {filename}")
+        logger.info("Uploaded bytes: %s", filename)
         return file
 
     def get_or_create_plan_folder(self, client_folder_id: str) -> str:
@@ -857,7 +1191,8 @@ class DriveManager:
 
         # Перевірка існування
         existing = self._find_file_by_name(filename, folder_id)
-        media = MediaIoBaseUpload(BytesIO(content.encode('utf-8')), mimetype='text/plain')
+        data = content.encode('utf-8')
+        media = MediaIoBaseUpload(BytesIO(data), mimetype='text/plain', resumable=len(data) > DRIVE_RESUMABLE_THRESHOLD)
 
         if existing:
             file = self.service.files().update(
@@ -865,29 +1200,26 @@ class DriveManager:
                 media_body=media,
                 fields='id, name, webViewLink, size'
             ).execute()
-            logger.info(f"Updated text file: {filename}")
+            logger.info("Updated text file: %s", filename)
         else:
             file = self.service.files().create(
                 body=file_metadata,
                 media_body=media,
                 fields='id, name, webViewLink, size'
             ).execute()
-            logger.info(f"Created text file: {filename}")
+            logger.info("Created text file: %s", filename)
 
         return file
 
     def _find_file_by_name(self, name, folder_id):
-        query = f"name='{name}' and '{folder_id}' in parents and trashed=false"
+        query = f"name={_drive_q(name)} and {_drive_q(folder_id)} in parents and trashed=false"
         results = self.service.files().list(q=query, spaces='drive', fields='files(id, name, webViewLink)').execute()
         items = results.get('files', [])
         return items[0] if items else None
 
     @staticmethod
     def _sanitize_name(name):
-        forbidden = '<>:"/\\|?*\x00-\x1F'
-        for char in forbidden:
-            name = name.replace(char, ' ')
-        return ' '.join(name.split())
+        return ' '.join(name.translate(_FORBIDDEN_NAME_CHARS).split())
 
 # ============================================================================
 # TELEGRAM BOT
@@ -954,11 +1286,95 @@ drive = DriveManager()
 notification_bot = None
 
 # Словник для зберігання message_id чек-листів клієнтів
-# client_telegram_id -> (chat_id, message_id)
+# client_telegram_id -> (chat_id, message_id, хеш останнього відправленого тексту і кнопок)
 client_checklist_messages = {}
 
+# Незмінні частини рядків і кнопок чек-листа — будуються один раз при імпорті
+def _checklist_label(key):
+    emoji, name = DOC_LABELS[key]
+    return f"{emoji} {name}".replace('{', '{{').replace('}', '}}')  # екрановано для str.format
+
+# (doc_key, шаблон рядка після завантаження з {count}, рядок до завантаження)
+REQUIRED_CHECKLIST_LINES = tuple(
+    (
+        key,
+        f"✅ {_checklist_label(key)} ({{count}} файл(ів))\n" if DOCUMENT_TYPES[key].get('multiple') else f"✅ {_checklist_label(key)}\n",
+        f"❌ {_checklist_label(key)}\n".format()
+    )
+    for key in REQUIRED_DOCUMENTS
+)
+OPTIONAL_CHECKLIST_LINES = tuple(
+    (key, f"✅ {_checklist_label(key)} ({{count}})\n", f"⚪️ {_checklist_label(key)}\n".format())
+    for key in OPTIONAL_DOCUMENTS
+)
+# (doc_key, текст після завантаження, текст до завантаження, callback_data)
+CHECKLIST_BUTTONS = tuple(
+    (key, f"✅ {name}", f"{emoji} {name}", f"{CALLBACK_UPLOAD_PREFIX}{key}")
+    for key, (emoji, name) in DOC_LABELS.items()
+)
+# Розкладка кнопок по 2 в ряд: exclude -> ряди; show_checklist виносить 'additional_docs' в останній ряд
+CHECKLIST_BUTTON_LAYOUTS = {
+    exclude: tuple(tuple(buttons[i:i + 2]) for i in range(0, len(buttons), 2))
+    for exclude, buttons in (
+        (None, CHECKLIST_BUTTONS),
+        ('additional_docs', tuple(b for b in CHECKLIST_BUTTONS if b[0] != 'additional_docs')),
+    )
+}
+
+def checklist_documents_text(uploaded_types):
+    """Блоки обов'язкових і додаткових документів чек-листа"""
+    parts = ["<b>Обов'язкові документи:</b>\n"]
+    parts += [
+        done.format(count=uploaded_types[key]) if key in uploaded_types else missing
+        for key, done, missing in REQUIRED_CHECKLIST_LINES
+    ]
+    if OPTIONAL_CHECKLIST_LINES:
+        parts.append("\n<b>Додаткові документи:</b>\n")
+        parts += [
+            done.format(count=uploaded_types[key]) if key in uploaded_types else missing
+            for key, done, missing in OPTIONAL_CHECKLIST_LINES
+        ]
+    return "".join(parts)
+
+def checklist_button_rows(uploaded_types, exclude=None):
+    """Кнопки документів по 2 в ряд (exclude — doc_key з CHECKLIST_BUTTON_LAYOUTS, який не показуємо в сітці)"""
+    return [
+        [
+            InlineKeyboardButton(done if key in uploaded_types else todo, callback_data=callback_data)
+            for key, done, todo, callback_data in row
+        ]
+        for row in CHECKLIST_BUTTON_LAYOUTS[exclude]
+    ]
+
+def checklist_content_hash(message, keyboard):
+    """Хеш тексту і кнопок чек-листа — щоб не робити edit без змін"""
+    return hash((message, tuple((b.text, b.callback_data) for row in keyboard for b in row)))
+
+# Відкладені оновлення чек-листів: client_id -> asyncio.Task
+_pending_checklist_updates = {}
+# Затримка (сек), за яку кілька завантажень підряд зливаються в одне редагування повідомлення
+CHECKLIST_UPDATE_DELAY = 1.0
+
 async def update_client_checklist(client_id, bot):
+    """
+    Запланувати оновлення чек-листа клієнта (якщо він відкритий). Виклики протягом CHECKLIST_UPDATE_DELAY
+    зливаються в один edit_message_text — стан читається з БД безпосередньо перед редагуванням
+    """
+    if client_id in _pending_checklist_updates:
+        return  # Оновлення вже заплановане і ще не читало стан
+
+    async def delayed_update():
+        try:
+            await asyncio.sleep(CHECKLIST_UPDATE_DELAY)
+        finally:
+            _pending_checklist_updates.pop(client_id, None)
+        await refresh_client_checklist(client_id, bot)
+
+    _pending_checklist_updates[client_id] = asyncio.create_task(delayed_update())
+
+async def refresh_client_checklist(client_id, bot):
     """Оновити чек-лист клієнта (якщо він відкритий)"""
+    telegram_id = None
     try:
         client = db.get_client_by_id(client_id)
         if not client or not client.get('telegram_id') or client['telegram_id'] == 0:
@@ -968,69 +1384,29 @@ async def update_client_checklist(client_id, bot):
         if telegram_id not in client_checklist_messages:
             return  # Чек-лист не відкритий
 
-        chat_id, message_id = client_checklist_messages[telegram_id]
+        chat_id, message_id, last_content_hash = client_checklist_messages[telegram_id]
 
         # Формуємо оновлений чек-лист
-        uploaded_types = db.get_uploaded_types(client['id'])
-        has_ecpass = db.get_ec_password(client['id']) is not None
+        uploaded_types, has_ecpass, _ = db.get_client_checklist_state(client['id'])
         if has_ecpass and 'ecpass' not in uploaded_types:
             uploaded_types['ecpass'] = 1
 
         required_count = len(REQUIRED_DOCUMENTS)
-        uploaded_required_count = sum(1 for doc in REQUIRED_DOCUMENTS if doc in uploaded_types)
+        uploaded_required_count = len(REQUIRED_DOCUMENT_SET.intersection(uploaded_types))
 
         # Прогрес-бар
         progress_bar = get_progress_bar(uploaded_required_count, required_count)
 
         message = f"📋 <b>Ваш прогрес: {uploaded_required_count}/{required_count} обов'язкових документів</b>\n\n"
         message += f"{progress_bar}\n\n"
-        message += "<b>Обов'язкові документи:</b>\n"
-
-        for doc_key in REQUIRED_DOCUMENTS:
-            doc_info = DOCUMENT_TYPES[doc_key]
-            emoji = doc_info['emoji']
-            name = doc_info.get('short', doc_info['name'])
-
-            if doc_key in uploaded_types:
-                count = uploaded_types[doc_key]
-                if doc_info.get('multiple'):
-                    message += f"✅ {emoji} {name} ({count} файл(ів))\n"
-                else:
-                    message += f"✅ {emoji} {name}\n"
-            else:
-                message += f"❌ {emoji} {name}\n"
-
-        optional_docs = [k for k in DOCUMENT_TYPES.keys() if k not in REQUIRED_DOCUMENTS]
-        if optional_docs:
-            message += f"\n<b>Додаткові документи:</b>\n"
-            for doc_key in optional_docs:
-                doc_info = DOCUMENT_TYPES[doc_key]
-                emoji = doc_info['emoji']
-                name = doc_info.get('short', doc_info['name'])
-
-                if doc_key in uploaded_types:
-                    count = uploaded_types[doc_key]
-                    message += f"✅ {emoji} {name} ({count})\n"
-                else:
-                    message += f"⚪️ {emoji} {name}\n"
-
+        message += checklist_documents_text(uploaded_types)
         message += f"\n💡 <i>Натисніть на документ нижче, щоб завантажити</i>"
 
-        # Створюємо кнопки
-        buttons = []
-        for doc_key, doc_info in DOCUMENT_TYPES.items():
-            emoji = doc_info['emoji']
-            name = doc_info.get('short', doc_info['name'])
-            if doc_key in uploaded_types:
-                button_text = f"✅ {name}"
-            else:
-                button_text = f"{emoji} {name}"
-            buttons.append(InlineKeyboardButton(button_text, callback_data=f"{CALLBACK_UPLOAD_PREFIX}{doc_key}"))
+        keyboard = checklist_button_rows(uploaded_types)
 
-        keyboard = []
-        for i in range(0, len(buttons), 2):
-            row = buttons[i:i+2]
-            keyboard.append(row)
+        content_hash = checklist_content_hash(message, keyboard)
+        if content_hash == last_content_hash:
+            return  # Нічого не змінилось — Telegram все одно відхилив би edit
 
         reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -1042,6 +1418,7 @@ async def update_client_checklist(client_id, bot):
             parse_mode='HTML',
             reply_markup=reply_markup
         )
+        client_checklist_messages[telegram_id] = (chat_id, message_id, content_hash)
         logger.info(f"Updated checklist for client {client_id} (telegram_id={telegram_id})")
 
     except Exception as e:
@@ -1050,8 +1427,18 @@ async def update_client_checklist(client_id, bot):
         if telegram_id in client_checklist_messages:
             client_checklist_messages.pop(telegram_id)
 
+class _KeepDigits(dict):
+    """Таблиця для str.translate: цифри лишаються, все інше (включно з не-ASCII) видаляється"""
+
+    def __missing__(self, key):
+        return None
+
+_DIGITS_ONLY = _KeepDigits({ord(c): c for c in '0123456789'})
+
+# Чиста функція від рядка — повторні номери (перереєстрація, адмінські /info) беремо з кешу
+@lru_cache(maxsize=4096)
 def normalize_phone(phone):
-    digits = ''.join(filter(str.isdigit, phone))
+    digits = phone.translate(_DIGITS_ONLY)
     if len(digits) == 10:
         return f"+380{digits}"
     elif len(digits) == 12 and digits.startswith('380'):
@@ -1086,17 +1473,23 @@ async def notify_admins(message, parse_mode='HTML'):
         logger.warning("No admins to notify")
         return
 
-    for admin_id in admin_ids:
-        try:
-            await notification_bot.send_message(
-                chat_id=admin_id,
-                text=message,
-                parse_mode=parse_mode,
-                disable_web_page_preview=True
-            )
-            logger.info(f"Notification sent to admin: {admin_id}")
-        except Exception as e:
-            logger.error(f"Failed to notify admin {admin_id}: {e}")
+    # Шлемо всім адмінам паралельно, але не більше 29 одночасно (глобальний ліміт Telegram — 30 повідомлень/с)
+    semaphore = asyncio.Semaphore(29)
+
+    async def send(admin_id):
+        async with semaphore:
+            try:
+                await notification_bot.send_message(
+                    chat_id=admin_id,
+                    text=message,
+                    parse_mode=parse_mode,
+                    disable_web_page_preview=True
+                )
+                logger.info(f"Notification sent to admin: {admin_id}")
+            except Exception as e:
+                logger.error(f"Failed to notify admin {admin_id}: {e}")
+
+    await asyncio.gather(*(send(admin_id) for admin_id in admin_ids))
 
 async def notify_plan_chat(message, parse_mode='HTML'):
     """Відправити нотифікацію в груповий чат плану"""
@@ -1134,11 +1527,17 @@ async def check_and_send_reminders(context: ContextTypes.DEFAULT_TYPE):
 
         logger.info(f"Found {len(inactive_clients)} inactive clients")
 
-        for client in inactive_clients:
-            try:
-                # Підраховуємо кількість днів неактивності
-                now_utc = datetime.now(timezone.utc)
+        # Логи нагадувань пишуться пачкою після розсилки (один INSERT замість двох на клієнта);
+        # finally — щоб відправлені нагадування записались навіть при збої посеред розсилки
+        sent_reminders = []
+        sent_notifications = []
+        admin_reports = []
+        now_utc = datetime.now(timezone.utc)
+        # Клієнтам шлемо паралельно, але не більше 25 одночасно (глобальний ліміт Telegram — 30 повідомлень/с)
+        semaphore = asyncio.Semaphore(25)
 
+        async def process_reminder(client):
+            try:
                 # Переконуємося що last_activity має timezone
                 last_activity = client['last_activity']
                 if last_activity.tzinfo is None:
@@ -1146,18 +1545,17 @@ async def check_and_send_reminders(context: ContextTypes.DEFAULT_TYPE):
 
                 days_inactive = (now_utc - last_activity).days
 
-                # Отримуємо останнє нагадування
-                last_reminder = db.get_last_reminder(client['id'])
+                # Останнє нагадування — з того ж запиту, що й клієнти
+                sent_at = client['last_reminder_at']
 
                 # Визначаємо чи потрібно надіслати нагадування
                 should_send = False
 
-                if not last_reminder:
+                if sent_at is None:
                     # Перше нагадування - якщо 3+ дні неактивності
                     should_send = days_inactive >= 3
                 else:
                     # Підраховуємо час з останнього нагадування
-                    sent_at = last_reminder['sent_at']
                     if sent_at.tzinfo is None:
                         sent_at = sent_at.replace(tzinfo=timezone.utc)
 
@@ -1170,63 +1568,73 @@ async def check_and_send_reminders(context: ContextTypes.DEFAULT_TYPE):
                         # 10+ днів - щоденно
                         should_send = days_since_last >= 1
 
-                if should_send:
-                    # Формуємо повідомлення залежно від прогресу
-                    uploaded_types = db.get_uploaded_types(client['id'])
-                    # Перевіряємо пароль ЕЦП
-                    has_ecpass = db.get_ec_password(client['id']) is not None
-                    if has_ecpass:
-                        uploaded_types['ecpass'] = 1
-                    # Рахуємо тільки обов'язкові документи
-                    required_uploaded = sum(1 for doc in REQUIRED_DOCUMENTS if doc in uploaded_types)
-                    required_total = len(REQUIRED_DOCUMENTS)
-
-                    if required_uploaded == 0:
-                        message = (
-                            f"👋 Вітаю, {client['full_name']}!\n\n"
-                            f"😊 Нагадуємо, що ви ще не завантажили жодного документа.\n\n"
-                            f"📋 Будь ласка, почніть завантаження документів, щоб прискорити процес обробки.\n\n"
-                            f"💡 Натисніть /start щоб побачити чек-лист документів."
-                        )
-                    else:
-                        message = (
-                            f"👋 Вітаю, {client['full_name']}!\n\n"
-                            f"📊 Ви завантажили {required_uploaded} з {required_total} обов'язкових документів.\n\n"
-                            f"😊 Будь ласка, завершіть завантаження решти документів.\n\n"
-                            f"🎁 Нагадуємо: при зборі всіх документів ви отримаєте бонус від компанії!\n\n"
-                            f"💡 Натисніть /start щоб продовжити."
-                        )
-
-                    # Відправляємо нагадування клієнту
-                    if client['telegram_id']:
-                        await context.bot.send_message(
-                            chat_id=client['telegram_id'],
-                            text=message,
-                            parse_mode='HTML'
-                        )
-
-                        # Логуємо відправлене нагадування
-                        db.log_reminder(client['id'], days_inactive)
-                        db.log_notification(
-                            client_id=client['id'],
-                            notification_type='reminder_sent',
-                            message=f"Нагадування надіслано ({days_inactive} днів неактивності)"
-                        )
-
-                        logger.info(f"Reminder sent to {client['full_name']} ({days_inactive} days inactive)")
-
-                        # Повідомляємо адмінів
-                        await notify_admins(
-                            f"🔔 Надіслано нагадування клієнту\n\n"
-                            f"👤 {client['full_name']}\n"
-                            f"📱 {client['phone']}\n"
-                            f"📊 Неактивний: {days_inactive} днів\n"
-                            f"📄 Завантажено: {required_uploaded}/{required_total} документів"
-                        )
+                if not should_send or not client['telegram_id']:
+                    return
+
+                # Формуємо повідомлення залежно від прогресу (обов'язкові документи пораховані в тому ж запиті)
+                required_uploaded = client['required_uploaded']
+                required_total = len(REQUIRED_DOCUMENTS)
+
+                if required_uploaded == 0:
+                    message = (
+                        f"👋 Вітаю, {client['full_name']}!\n\n"
+                        f"😊 Нагадуємо, що ви ще не завантажили жодного документа.\n\n"
+                        f"📋 Будь ласка, почніть завантаження документів, щоб прискорити процес обробки.\n\n"
+                        f"💡 Натисніть /start щоб побачити чек-лист документів."
+                    )
+                else:
+                    message = (
+                        f"👋 Вітаю, {client['full_name']}!\n\n"
+                        f"📊 Ви завантажили {required_uploaded} з {required_total} обов'язкових документів.\n\n"
+                        f"😊 Будь ласка, завершіть завантаження решти документів.\n\n"
+                        f"🎁 Нагадуємо: при зборі всіх документів ви отримаєте бонус від компанії!\n\n"
+                        f"💡 Натисніть /start щоб продовжити."
+                    )
+
+                # Відправляємо нагадування клієнту
+                async with semaphore:
+                    await context.bot.send_message(
+                        chat_id=client['telegram_id'],
+                        text=message,
+                        parse_mode='HTML'
+                    )
+
+                # Логуємо відправлене нагадування (запис у БД — пачкою після розсилки)
+                sent_reminders.append((client['id'], days_inactive))
+                sent_notifications.append((
+                    client['id'], 'reminder_sent',
+                    f"Нагадування надіслано ({days_inactive} днів неактивності)", None
+                ))
+
+                logger.info(f"Reminder sent to {client['full_name']} ({days_inactive} days inactive)")
+
+                # Звіт для адмінів — одним повідомленням після розсилки
+                admin_reports.append(
+                    f"👤 {client['full_name']}\n"
+                    f"📱 {client['phone']}\n"
+                    f"📊 Неактивний: {days_inactive} днів\n"
+                    f"📄 Завантажено: {required_uploaded}/{required_total} документів"
+                )
 
             except Exception as e:
                 logger.error(f"Error sending reminder to client {client['id']}: {e}")
-                continue
+
+        try:
+            await asyncio.gather(*(process_reminder(client) for client in inactive_clients))
+        finally:
+            db.log_reminders(sent_reminders)
+            db.log_notifications(sent_notifications)
+
+        # Повідомляємо адмінів: звіти склеюємо в повідомлення до ліміту Telegram (4096 символів)
+        header = f"🔔 Надіслано нагадування клієнтам: {len(admin_reports)}\n\n"
+        batch = header
+        for report in admin_reports:
+            if len(batch) + len(report) + 2 > 4000 and batch != header:
+                await notify_admins(batch.rstrip())
+                batch = header
+            batch += report + "\n\n"
+        if admin_reports:
+            await notify_admins(batch.rstrip())
 
         logger.info("Reminder check completed")
 
@@ -1358,7 +1766,6 @@ async def check_and_apply_crm_stage(client: dict, context) -> bool:
     Перевіряє стадію клієнта в CRM і якщо вона нова — оновлює БД + відправляє вітання.
     Повертає True якщо клієнт переведений у пост-план режим.
     """
-    import asyncio
     if not BITRIX_WEBHOOK or not client.get('phone'):
         return False
 
@@ -1578,12 +1985,12 @@ async def handle_receipt_file(update: Update, context: ContextTypes.DEFAULT_TYPE
         # Отримуємо або створюємо папку "Квитанції"
         plan_folder_id = client.get('plan_folder_id')
         if not plan_folder_id:
-            plan_folder_id = drive.get_or_create_plan_folder(client['drive_folder_id'])
+            plan_folder_id = await asyncio.to_thread(drive.get_or_create_plan_folder, client['drive_folder_id'])
             db.update_plan_folder(client['id'], plan_folder_id)
 
         # Завантажуємо файл
         file_bytes = await tg_file.download_as_bytearray()
-        uploaded = drive.upload_bytes(bytes(file_bytes), filename, plan_folder_id, mimetype)
+        uploaded = await asyncio.to_thread(drive.upload_bytes, bytes(file_bytes), filename, plan_folder_id, mimetype)
         file_url = uploaded.get('webViewLink', '')
 
         # Записуємо в БД
@@ -1745,8 +2152,8 @@ async def admin_upload_plan_file(update: Update, context: ContextTypes.DEFAULT_T
         filename = doc.file_name or f"plan_{client_id}.pdf"
         mimetype = doc.mime_type or 'application/pdf'
 
-        plan_subfolder_id = drive.get_or_create_folder('План', folder_id)
-        uploaded = drive.upload_bytes(bytes(file_bytes), filename, plan_subfolder_id, mimetype)
+        plan_subfolder_id = await asyncio.to_thread(drive.get_or_create_folder, 'План', folder_id)
+        uploaded = await asyncio.to_thread(drive.upload_bytes, bytes(file_bytes), filename, plan_subfolder_id, mimetype)
         file_drive_id = uploaded.get('id', '')
         file_url = uploaded.get('webViewLink', '')
 
@@ -1793,7 +2200,6 @@ async def check_crm_stages(context: ContextTypes.DEFAULT_TYPE):
             if not client.get('phone'):
                 continue
 
-            import asyncio
             new_stage = await asyncio.to_thread(get_crm_stage_by_phone, client['phone'])
 
             if new_stage not in BITRIX_NEW_STAGES:
@@ -1988,6 +2394,7 @@ async def receive_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "UPDATE docbot.clients SET telegram_id = %s, full_name = %s, last_activity = CURRENT_TIMESTAMP WHERE id = %s",
                 (update.effective_user.id, full_name, client['id'])
             )
+            db.forget_client(client['id'])
             client = db.get_client_by_id(client['id'])
         if not client:
             await update.message.reply_text(
@@ -1996,7 +2403,7 @@ async def receive_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return ConversationHandler.END
 
     try:
-        folders = drive.create_client_folder_structure(full_name, phone)
+        folders = await asyncio.to_thread(drive.create_client_folder_structure, full_name, phone)
         db.update_client_drive_folder(client['id'], folders['client']['id'], folders['client']['webViewLink'])
         context.user_data['folders'] = folders
 
@@ -2141,52 +2548,22 @@ async def show_checklist(update: Update, context: ContextTypes.DEFAULT_TYPE, for
             await update.message.reply_text(message)
         return
 
-    uploaded_types = db.get_uploaded_types(client['id'])
-    has_ecpass = db.get_ec_password(client['id']) is not None
+    uploaded_types, has_ecpass, declaration_status = db.get_client_checklist_state(client['id'])
     if has_ecpass and 'ecpass' not in uploaded_types:
         uploaded_types['ecpass'] = 1
 
     required_count = len(REQUIRED_DOCUMENTS)
-    uploaded_required_count = sum(1 for doc in REQUIRED_DOCUMENTS if doc in uploaded_types)
+    uploaded_required_count = len(REQUIRED_DOCUMENT_SET.intersection(uploaded_types))
 
     # Прогрес-бар
     progress_bar = get_progress_bar(uploaded_required_count, required_count)
 
     message = f"📋 <b>Ваш прогрес: {uploaded_required_count}/{required_count} обов'язкових документів</b>\n\n"
     message += f"{progress_bar}\n\n"
-    message += "<b>Обов'язкові документи:</b>\n"
-
-    for doc_key in REQUIRED_DOCUMENTS:
-        doc_info = DOCUMENT_TYPES[doc_key]
-        emoji = doc_info['emoji']
-        name = doc_info.get('short', doc_info['name'])
-
-        if doc_key in uploaded_types:
-            count = uploaded_types[doc_key]
-            if doc_info.get('multiple'):
-                message += f"✅ {emoji} {name} ({count} файл(ів))\n"
-            else:
-                message += f"✅ {emoji} {name}\n"
-        else:
-            message += f"❌ {emoji} {name}\n"
-
-    optional_docs = [k for k in DOCUMENT_TYPES.keys() if k not in REQUIRED_DOCUMENTS]
-    if optional_docs:
-        message += f"\n<b>Додаткові документи:</b>\n"
-        for doc_key in optional_docs:
-            doc_info = DOCUMENT_TYPES[doc_key]
-            emoji = doc_info['emoji']
-            name = doc_info.get('short', doc_info['name'])
-
-            if doc_key in uploaded_types:
-                count = uploaded_types[doc_key]
-                message += f"✅ {emoji} {name} ({count})\n"
-            else:
-                message += f"⚪️ {emoji} {name}\n"
+    message += checklist_documents_text(uploaded_types)
 
     # Додаємо статус анкети декларації
-    declaration = db.get_declaration(client['id'])
-    declaration_completed = declaration and declaration['status'] == 'completed'
+    declaration_completed = declaration_status == 'completed'
 
     message += f"\n<b>Анкета:</b>\n"
     if declaration_completed:
@@ -2196,26 +2573,8 @@ async def show_checklist(update: Update, context: ContextTypes.DEFAULT_TYPE, for
 
     message += f"\n💡 <i>Натисніть на документ нижче, щоб завантажити</i>"
 
-    # Создаём кнопки и группируем их по 2 в строке
-    # Исключаем 'additional_docs' из основного списка
-    buttons = []
-    for doc_key, doc_info in DOCUMENT_TYPES.items():
-        if doc_key == 'additional_docs':
-            continue  # Пропускаем, добавим отдельно в конце
-        emoji = doc_info['emoji']
-        name = doc_info.get('short', doc_info['name'])
-        # Меняем emoji с обычного на ✅ после загрузки
-        if doc_key in uploaded_types:
-            button_text = f"✅ {name}"
-        else:
-            button_text = f"{emoji} {name}"
-        buttons.append(InlineKeyboardButton(button_text, callback_data=f"{CALLBACK_UPLOAD_PREFIX}{doc_key}"))
-
-    # Группируем кнопки по 2 в строке
-    keyboard = []
-    for i in range(0, len(buttons), 2):
-        row = buttons[i:i+2]
-        keyboard.append(row)
+    # Кнопки по 2 в строке; 'additional_docs' добавим отдельно в конце
+    keyboard = checklist_button_rows(uploaded_types, exclude='additional_docs')
 
     # Додаємо останній ряд: "Анкета декларації" (зліва) + "Додаткові документи" (справа)
     if declaration_completed:
@@ -2242,7 +2601,9 @@ async def show_checklist(update: Update, context: ContextTypes.DEFAULT_TYPE, for
         sent_msg = await query.edit_message_text(message, parse_mode='HTML', reply_markup=reply_markup)
         # Зберігаємо message_id для оновлення (тільки для реальних клієнтів, не адмінів)
         if not admin_id and client.get('telegram_id'):
-            client_checklist_messages[client['telegram_id']] = (update.effective_chat.id, query.message.message_id)
+            client_checklist_messages[client['telegram_id']] = (
+                update.effective_chat.id, query.message.message_id, checklist_content_hash(message, keyboard)
+            )
     else:
         # Отправляем новое сообщение (либо нет query, либо force_new_message=True)
         if query:
@@ -2250,7 +2611,9 @@ async def show_checklist(update: Update, context: ContextTypes.DEFAULT_TYPE, for
         sent_msg = await update.effective_chat.send_message(message, parse_mode='HTML', reply_markup=reply_markup)
         # Зберігаємо message_id для оновлення (тільки для реальних клієнтів, не адмінів)
         if not admin_id and client.get('telegram_id'):
-            client_checklist_messages[client['telegram_id']] = (update.effective_chat.id, sent_msg.message_id)
+            client_checklist_messages[client['telegram_id']] = (
+                update.effective_chat.id, sent_msg.message_id, checklist_content_hash(message, keyboard)
+            )
 
 async def handle_upload_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -2382,13 +2745,14 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             logger.info(f"ECP password saved to DB: password_id={password_id}, client_id={client['id']}, password={password}")
 
             # Сохраняем на Drive
-            folders = drive.create_client_folder_structure(client['full_name'], client['phone'])
+            folders = await asyncio.to_thread(
+                drive.create_client_folder_structure, client['full_name'], client['phone'], client.get('drive_folder_id')
+            )
             personal_folder_id = folders['personal']['id']
-            drive.create_text_file(password, 'Пароль_ЕЦП.txt', personal_folder_id)
+            await asyncio.to_thread(drive.create_text_file, password, 'Пароль_ЕЦП.txt', personal_folder_id)
             logger.info(f"ECP password file created on Drive for client_id={client['id']}")
 
             # Пушимо пароль у Bitrix24
-            import asyncio
             asyncio.get_event_loop().run_in_executor(
                 None, push_ecp_password_to_bitrix, client['phone'], password
             )
@@ -2421,7 +2785,6 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
 
             # Показываем чеклист новым сообщением
-            import asyncio
             await asyncio.sleep(0.5)
             await show_checklist(update, context, force_new_message=True)
 
@@ -2432,7 +2795,6 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
 
     elif doc_info.get('is_text_email'):
-        import asyncio
         step = context.user_data.get('emailpass_step', 'email')
 
         if step == 'email':
@@ -2454,10 +2816,12 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             password = update.message.text.strip()
 
             try:
-                folders = drive.create_client_folder_structure(client['full_name'], client['phone'])
+                folders = await asyncio.to_thread(
+                    drive.create_client_folder_structure, client['full_name'], client['phone'], client.get('drive_folder_id')
+                )
                 personal_folder_id = folders['personal']['id']
                 file_content = f"Email: {email}\nПароль: {password}"
-                drive.create_text_file(file_content, 'Пошта_та_пароль.txt', personal_folder_id)
+                await asyncio.to_thread(drive.create_text_file, file_content, 'Пошта_та_пароль.txt', personal_folder_id)
 
                 # Пушимо в Bitrix24
                 asyncio.get_event_loop().run_in_executor(
@@ -2601,7 +2965,7 @@ async def handle_file_upload(update: Update, context: ContextTypes.DEFAULT_TYPE)
         file_ext = os.path.splitext(original_file_name)[1]
 
         # Создаём новое имя файла: ТипДокумента_Имя_Фамилия.расширение
-        doc_type_name = doc_info.get('short', doc_info['name']).replace('/', '_').replace('\\', '_')
+        doc_type_name = DOC_FILE_NAMES[doc_key]
         client_name_parts = client['full_name'].split()
         if len(client_name_parts) >= 2:
             # Имя Фамилия (первые 2 слова)
@@ -2622,7 +2986,7 @@ async def handle_file_upload(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if doc_info.get('skip_ai_validation', False):
             validation_result = None
         else:
-            validation_result = ai_validator.validate_document(temp_path, doc_key)
+            validation_result = await ai_validator.validate_document(temp_path, doc_key)
 
         # Якщо документ REJECTED - НЕ завантажуємо на Drive
         if validation_result and validation_result.is_rejected():
@@ -2659,14 +3023,16 @@ async def handle_file_upload(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # ЗАВАНТАЖЕННЯ НА DRIVE (для ACCEPTED та UNCERTAIN)
         # ============================================================================
         folder_type = doc_info['folder']
-        folders = drive.create_client_folder_structure(client['full_name'], client['phone'])
+        folders = await asyncio.to_thread(
+            drive.create_client_folder_structure, client['full_name'], client['phone'], client.get('drive_folder_id')
+        )
         target_folder_id = folders[folder_type]['id']
 
         # Загружаем с новым именем
-        drive_file = drive.upload_file(temp_path, target_folder_id, new_file_name)
+        drive_file = await asyncio.to_thread(drive.upload_file, temp_path, target_folder_id, new_file_name)
 
-        # Додаємо документ в БД
-        document_id = db.add_document(
+        # Додаємо документ в БД (разом з результатом AI-валідації, якщо є)
+        document_fields = dict(
             client_id=client['id'],
             document_type=doc_key,
             file_name=new_file_name,
@@ -2675,11 +3041,23 @@ async def handle_file_upload(update: Update, context: ContextTypes.DEFAULT_TYPE)
             file_size=int(drive_file.get('size', 0)),
             uploaded_by_admin_id=admin_id
         )
+        document_id = None
+        if validation_result:
+            try:
+                document_id = db.add_document_with_validation(
+                    validation_status=validation_result.status,
+                    ai_response=validation_result.ai_response,
+                    **document_fields
+                )
+            except Exception as e:
+                # Логуємо помилку БД, але не показуємо користувачу; документ зберігаємо без валідації
+                logger.error(f"Error saving AI validation to DB: {e}", exc_info=True)
+        if document_id is None:
+            document_id = db.add_document(**document_fields)
 
         # Якщо це ЕЦП — пушимо файл у Bitrix24 у фоні
         if doc_key == 'ecp':
             try:
-                import asyncio
                 with open(temp_path, 'rb') as _f:
                     _ecp_bytes = _f.read()
                 asyncio.get_event_loop().run_in_executor(
@@ -2688,19 +3066,6 @@ async def handle_file_upload(update: Update, context: ContextTypes.DEFAULT_TYPE)
             except Exception as _e:
                 logger.error(f"ECP file Bitrix push error: {_e}")
 
-        # Зберігаємо результат AI-валідації (якщо є)
-        if validation_result:
-            try:
-                db.save_document_validation(
-                    document_id=document_id,
-                    validation_status=validation_result.status,
-                    ai_response=validation_result.ai_response
-                )
-                db.update_document_validation_status(document_id, validation_result.status)
-            except Exception as e:
-                # Логуємо помилку БД, але не показуємо користувачу
-                logger.error(f"Error saving AI validation to DB: {e}", exc_info=True)
-
         # Логируем в notifications_log
         notification_type = 'document_uploaded'
         if validation_result:
@@ -2720,11 +3085,10 @@ async def handle_file_upload(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # Об'єднана нотифікація з прогресом і статусом AI
         if not admin_id:
             # Рахуємо прогрес
-            uploaded_types = db.get_uploaded_types(client['id'])
-            has_ecpass = db.get_ec_password(client['id']) is not None
+            uploaded_types, has_ecpass, _ = db.get_client_checklist_state(client['id'])
             if has_ecpass:
                 uploaded_types['ecpass'] = 1
-            required_uploaded = sum(1 for doc in REQUIRED_DOCUMENTS if doc in uploaded_types)
+            required_uploaded = len(REQUIRED_DOCUMENT_SET.intersection(uploaded_types))
             required_total = len(REQUIRED_DOCUMENTS)
 
             # Визначаємо статус AI для повідомлення
@@ -2840,11 +3204,13 @@ async def handle_additional_doc_name(update: Update, context: ContextTypes.DEFAU
         doc_key = context.user_data.get('uploading_doc_type')
         doc_info = DOCUMENT_TYPES.get(doc_key)
         folder_type = doc_info['folder']
-        folders = drive.create_client_folder_structure(client['full_name'], client['phone'])
+        folders = await asyncio.to_thread(
+            drive.create_client_folder_structure, client['full_name'], client['phone'], client.get('drive_folder_id')
+        )
         target_folder_id = folders[folder_type]['id']
 
         # Завантажуємо файл на Drive
-        drive_file = drive.upload_file(temp_path, target_folder_id, new_file_name)
+        drive_file = await asyncio.to_thread(drive.upload_file, temp_path, target_folder_id, new_file_name)
 
         # Додаємо документ в БД
         document_id = db.add_document(
@@ -2949,12 +3315,11 @@ async def handle_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.pop('ec_password', None)
     context.user_data.pop('upload_status_message', None)
 
-    uploaded_types = db.get_uploaded_types(client['id'])
-    has_ecpass = db.get_ec_password(client['id']) is not None
+    uploaded_types, has_ecpass, _ = db.get_client_checklist_state(client['id'])
     if has_ecpass:
         uploaded_types['ecpass'] = 1
 
-    required_uploaded = sum(1 for doc in REQUIRED_DOCUMENTS if doc in uploaded_types)
+    required_uploaded = len(REQUIRED_DOCUMENT_SET.intersection(uploaded_types))
     required_total = len(REQUIRED_DOCUMENTS)
 
     # Додаємо прогрес-бар
@@ -3055,7 +3420,6 @@ async def handle_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.edit_message_text(message, parse_mode='HTML')
 
     # Показываем чеклист новым сообщением
-    import asyncio
     await asyncio.sleep(0.5)
     await show_checklist(update, context, force_new_message=True)
 
@@ -3191,14 +3555,10 @@ async def declaration_begin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     declaration = db.get_or_create_declaration(client['id'], attempt)
 
     # Знаходимо перше питання без відповіді (відновлюємо прогрес)
-    current_question_index = 0
-    for idx, question in enumerate(DECLARATION_QUESTIONS):
-        answer = declaration.get(question['key'])
-        if not answer:
-            current_question_index = idx
-            break
-    else:
-        current_question_index = len(DECLARATION_QUESTIONS) - 1
+    current_question_index = next(
+        (idx for idx, key in enumerate(DECLARATION_QUESTION_KEYS) if not declaration.get(key)),
+        len(DECLARATION_QUESTION_KEYS) - 1
+    )
 
     context.user_data['declaration_current_q'] = current_question_index
     context.user_data['declaration_id'] = declaration['id']
@@ -3392,7 +3752,9 @@ async def declaration_handle_files(update: Update, context: ContextTypes.DEFAULT
             await tg_file.download_to_drive(temp_path)
 
             # Отримуємо або створюємо папку клієнта
-            folders = drive.create_client_folder_structure(client['full_name'], client['phone'])
+            folders = await asyncio.to_thread(
+                drive.create_client_folder_structure, client['full_name'], client['phone'], client.get('drive_folder_id')
+            )
 
             # Перевіряємо що папка клієнта існує
             if not folders or 'client' not in folders or not folders['client']:
@@ -3423,7 +3785,7 @@ async def declaration_handle_files(update: Update, context: ContextTypes.DEFAULT
                 logger.info(f"Created 'Декларація' folder for client {client['full_name']}")
 
             # Завантажуємо файл
-            drive_file = drive.upload_file(temp_path, declaration_folder_id, file.file_name)
+            drive_file = await asyncio.to_thread(drive.upload_file, temp_path, declaration_folder_id, file.file_name)
 
             # Додаємо до списку
             context.user_data['declaration_files'].append({
@@ -3559,7 +3921,9 @@ async def declaration_complete(update: Update, context: ContextTypes.DEFAULT_TYP
             f.write(content)
 
         # Отримуємо або створюємо папку клієнта та підпапку "Декларація"
-        folders = drive.create_client_folder_structure(client['full_name'], client['phone'])
+        folders = await asyncio.to_thread(
+            drive.create_client_folder_structure, client['full_name'], client['phone'], client.get('drive_folder_id')
+        )
 
         # Перевіряємо що папка клієнта існує
         if not folders or 'client' not in folders or not folders['client']:
@@ -3594,7 +3958,7 @@ async def declaration_complete(update: Update, context: ContextTypes.DEFAULT_TYP
             file_name = f"Анкета_{client['full_name']}_Спроба2.txt"
         else:
             file_name = f"Анкета_{client['full_name']}.txt"
-        drive.upload_file(temp_path, declaration_folder_id, file_name)
+        await asyncio.to_thread(drive.upload_file, temp_path, declaration_folder_id, file_name)
         os.remove(temp_path)
 
         # Оновлюємо статус декларації
@@ -3644,7 +4008,6 @@ async def declaration_complete(update: Update, context: ContextTypes.DEFAULT_TYP
         context.user_data.pop('declaration_files', None)
 
         # Автоматично показуємо чек-лист (як після завантаження документів)
-        import asyncio
         await asyncio.sleep(0.5)
         await show_checklist(update, context, force_new_message=True)
 
@@ -3774,7 +4137,7 @@ async def admin_login(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     uploaded_types = db.get_uploaded_types(client['id'])
     required_count = len(REQUIRED_DOCUMENTS)
-    uploaded_required = sum(1 for doc in REQUIRED_DOCUMENTS if doc in uploaded_types)
+    uploaded_required = len(REQUIRED_DOCUMENT_SET.intersection(uploaded_types))
 
     await update.message.reply_text(
         f"✅ <b>Увійшли в режим адміністратора</b>\n\n"
@@ -3825,7 +4188,7 @@ async def admin_register(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         # Створюємо папки на Drive
-        folders = drive.create_client_folder_structure(full_name, phone)
+        folders = await asyncio.to_thread(drive.create_client_folder_structure, full_name, phone)
         db.update_client_drive_folder(client['id'], folders['client']['id'], folders['client']['webViewLink'])
 
         # Логуємо
@@ -3954,10 +4317,23 @@ async def test_notify_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 # MAIN
 # ============================================================================
 
+async def flush_activity_job(context: ContextTypes.DEFAULT_TYPE):
+    """Періодично скидає накопичені last_activity в БД"""
+    try:
+        db.flush_last_activity()
+    except Exception as e:
+        logger.error(f"Error flushing last_activity: {e}")
+
+async def flush_activity_on_shutdown(application: Application):
+    try:
+        db.flush_last_activity()
+    except Exception as e:
+        logger.error(f"Error flushing last_activity on shutdown: {e}")
+
 def main():
     global notification_bot
 
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = Application.builder().token(TELEGRAM_BOT_TOKEN).post_shutdown(flush_activity_on_shutdown).build()
 
     if NOTIFICATION_BOT_TOKEN:
         from telegram import Bot
@@ -4090,11 +4466,31 @@ def main():
     except Exception as e:
         logger.error(f"Error creating plan tables: {e}")
 
+    try:
+        db.create_phone_column()
+        logger.info("Phone column created/verified")
+    except Exception as e:
+        logger.error(f"Error creating phone column: {e}")
+
+    try:
+        db.create_document_indexes()
+        logger.info("Document indexes created/verified")
+    except Exception as e:
+        logger.error(f"Error creating document indexes: {e}")
+
     # Налаштовуємо JobQueue
     job_queue = application.job_queue
     import datetime as dt
     kyiv_tz = pytz.timezone('Europe/Kiev')
 
+    # Буфер last_activity пишемо в БД раз на ACTIVITY_FLUSH_INTERVAL секунд
+    job_queue.run_repeating(
+        flush_activity_job,
+        interval=ACTIVITY_FLUSH_INTERVAL,
+        first=ACTIVITY_FLUSH_INTERVAL,
+        name="last_activity_flush"
+    )
+
     # Щоденна перевірка неактивних клієнтів о 14:23
     job_queue.run_daily(
         check_and_send_reminders,
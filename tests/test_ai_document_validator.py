@@ -0,0 +1,99 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_document_validator as adv  # noqa: E402
+
+
+class _FakeAsyncOpenAI:
+    """Запам'ятовує event loop, в якому створений (як httpx-пул справжнього клієнта)"""
+
+    def __init__(self, **kwargs):
+        self.loop = asyncio.get_running_loop()
+        self.closed = False
+        self.responses = SimpleNamespace(create=None)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_validate_document_sync_twice_uses_client_of_current_loop(monkeypatch, tmp_path):
+    monkeypatch.setattr(adv, 'OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(adv, 'AsyncOpenAI', _FakeAsyncOpenAI)
+    monkeypatch.setattr(adv, 'AI_PDF_CACHE_PATH', str(tmp_path / 'file_ids.sqlite3'))
+
+    clients = []
+
+    async def fake_validate_document(self, file_path, document_type):
+        client = adv._get_client()
+        # клієнт з уже закритого loop дав би "Event loop is closed" на першому ж запиті
+        assert client.loop is asyncio.get_running_loop()
+        clients.append(client)
+        return adv.ValidationResult(status='accepted')
+
+    monkeypatch.setattr(adv.AIDocumentValidator, 'validate_document', fake_validate_document)
+
+    validator = adv.AIDocumentValidator()
+    first = validator.validate_document_sync('passport.jpg', 'passport')
+    second = validator.validate_document_sync('passport.jpg', 'passport')
+
+    assert first.is_accepted() and second.is_accepted()
+    assert clients[0] is not clients[1]
+    assert all(client.closed for client in clients)
+
+
+class _StaleFileError(Exception):
+    pass
+
+
+def test_stale_cached_file_id_is_evicted_and_reuploaded(monkeypatch, tmp_path):
+    monkeypatch.setattr(adv, 'OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(adv, 'AsyncOpenAI', _FakeAsyncOpenAI)
+    monkeypatch.setattr(adv, 'AI_PDF_CACHE_PATH', str(tmp_path / 'file_ids.sqlite3'))
+    monkeypatch.setattr(adv, '_STALE_FILE_ERRORS', (_StaleFileError,))
+
+    validator = adv.AIDocumentValidator()
+    validator._file_id_cache.set('doc', 'file-old')
+    requested = []
+
+    async def upload(refresh):
+        if refresh:
+            validator._file_id_cache.delete('doc')
+            validator._file_id_cache.set('doc', 'file-new')
+            return 'file-new', False
+        return validator._file_id_cache.get('doc'), True
+
+    async def fake_create_with_retry(self, what, create, **kwargs):
+        file_id = kwargs['input'][0]['content'][1]['file_id']
+        requested.append(file_id)
+        if file_id == 'file-old':
+            raise _StaleFileError('file not found')
+        return 'response'
+
+    monkeypatch.setattr(adv.AIDocumentValidator, '_create_with_retry', fake_create_with_retry)
+
+    async def run():
+        try:
+            return await validator._create_with_file(
+                'test', 'model', 'prompt', upload,
+                lambda file_id: {'type': 'input_file', 'file_id': file_id},
+            )
+        finally:
+            await adv._close_client()
+
+    assert asyncio.run(run()) == 'response'
+    assert requested == ['file-old', 'file-new']
+    assert validator._file_id_cache.get('doc') == 'file-new'
+
+
+def test_file_id_cache_is_opened_on_first_use(tmp_path):
+    path = tmp_path / 'cache' / 'file_ids.sqlite3'
+    cache = adv.FileIdCache(str(path), ttl=60)
+    assert not path.exists()
+
+    cache.set('doc', 'file-1')
+    assert path.exists()
+    assert cache.get('doc') == 'file-1'
@@ -0,0 +1,170 @@
+import os
+import re
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sync_to_sheets as sts  # noqa: E402
+
+
+def _sql_phone_e164(phone):
+    """CASE з PHONE_E164_DDL, переписаний на Python один в один"""
+    digits = re.sub('[^0-9]', '', phone, flags=re.ASCII)
+    if digits[:3] == '380':
+        return digits
+    if digits[:1] == '0':
+        return '38' + digits
+    if len(digits) == 10:
+        return '380' + digits
+    return digits
+
+
+@pytest.mark.parametrize('phone, expected', [
+    ('+380 (50) 123-45-67', '380501234567'),
+    ('050 123 45 67', '380501234567'),
+    ('5012345678', '3805012345678'),
+    ('501234567', '501234567'),
+    ('+1 555 0100', '15550100'),
+    ('0', '380'),
+    ('тел. ٠٥٠ 123', '123'),
+    ('', ''),
+])
+def test_normalize_phone_matches_sql_phone_e164(phone, expected):
+    assert sts.normalize_phone(phone) == expected
+    assert _sql_phone_e164(phone) == expected
+
+
+def test_doc_mask_ignores_unknown_types():
+    assert sts.doc_mask([]) == 0
+    assert sts.doc_mask(['passport', 'unknown', 'story']) == sts._DOC_BITS['passport'] | sts._DOC_BITS['story']
+    assert sts._BOOL_VECS[sts.doc_mask(sts.DOC_TYPES)] == (True,) * len(sts.DOC_TYPES)
+
+
+def test_fill_client_details_matches_new_client_row():
+    data = {
+        'full_name': 'Іван',
+        'telegram_id': 42,
+        'created_at': None,
+        'drive_folder_url': 'https://drive/folder',
+        'doc_types': frozenset({'passport', 'workbook', 'not-a-column'}),
+        'screening': {'is_fraud_victim': True, 'income_over_30k': False},
+    }
+    full_row = sts.new_client_row('380501234567', data, '01.02.2026')
+
+    details = sts.fill_client_details(
+        [''] * (sts.DETAILS_LAST_COL - sts.DETAILS_FIRST_COL + 1), sts.DETAILS_FIRST_COL,
+        data['drive_folder_url'], data['doc_types'], sts.screening_display(data['screening'])
+    )
+    details[sts.COLUMNS['phone'] - sts.DETAILS_FIRST_COL] = '380501234567'
+    details[sts.COLUMNS['telegram'] - sts.DETAILS_FIRST_COL] = sts.telegram_link(42)
+
+    assert details == full_row[sts.DETAILS_FIRST_COL:sts.DETAILS_LAST_COL + 1]
+    assert full_row[sts.COLUMNS['passport']] is True
+    assert full_row[sts.COLUMNS['ecp']] is False
+    assert full_row[sts.COLUMNS['is_fraud_victim']] == 'Так'
+    assert full_row[sts.COLUMNS['income_over_30k']] == 'Ні'
+    assert full_row[sts.COLUMNS['has_sold_property']] == ''
+
+
+def _row(phone):
+    return sts.new_client_row(phone, {
+        'full_name': '', 'telegram_id': None, 'created_at': None,
+        'drive_folder_url': '', 'doc_types': frozenset(), 'screening': {},
+    }, '01.01.2026')
+
+
+def test_sheet_index_after_sync_without_changes():
+    kept = {'380501111111': 2, '380502222222': 3}
+    assert sts.sheet_index_after_sync(kept, [], [], []) == (kept, 3)
+
+
+def test_sheet_index_after_sync_tracks_every_appended_chunk():
+    kept = {'380501111111': 2, '380502222222': 3}
+    new_rows = [_row('380503333333'), _row('380504444444'), _row('380505555555')]
+    # перша частина лягла під рядки без телефону (6-7), друга — одразу під неї
+    first_rows, last_row = sts.sheet_index_after_sync(kept, [(6, 2), (8, 1)], new_rows, [])
+    assert first_rows == {
+        '380501111111': 2, '380502222222': 3,
+        '380503333333': 6, '380504444444': 7, '380505555555': 8,
+    }
+    assert last_row == 8
+
+
+def test_sheet_index_after_sync_shifts_rows_below_a_later_insert():
+    kept = {'380501111111': 2}
+    new_rows = [_row('380503333333'), _row('380504444444')]
+    # друга частина вставлена над першою — перша зсувається вниз
+    first_rows, last_row = sts.sheet_index_after_sync(kept, [(5, 1), (4, 1)], new_rows, [])
+    assert first_rows == {'380501111111': 2, '380503333333': 6, '380504444444': 4}
+    assert last_row == 6
+
+
+def test_sheet_index_after_sync_applies_deleted_duplicates():
+    kept = {'380501111111': 2, '380502222222': 5}
+    new_rows = [_row('380503333333')]
+    first_rows, last_row = sts.sheet_index_after_sync(kept, [(6, 1)], new_rows, [3, 4, 3])
+    assert first_rows == {'380501111111': 2, '380502222222': 3, '380503333333': 4}
+    assert last_row == 4
+
+
+def test_sheet_index_after_sync_empty_sheet():
+    assert sts.sheet_index_after_sync({}, [], [], []) == ({}, sts.FIRST_DATA_ROW - 1)
+
+
+@pytest.mark.parametrize('a1_range, expected', [
+    ("'Клієнти'!A12:S20", 12),
+    ("'Sheet!1'!AB7", 7),
+    ('', 5),
+])
+def test_range_first_row(a1_range, expected):
+    assert sts._range_first_row(a1_range, 5) == expected
+
+
+def test_scan_phones_marks_duplicates_and_skips_blanks():
+    rows = [(2, '050 111 11 11'), (3, ''), (4, '380501111111'), (5, 'n/a'), (6, '0502222222')]
+    assert sts._scan_phones(rows) == ({'380501111111': 2, '380502222222': 6}, [4], 6)
+
+
+@pytest.mark.parametrize('value, expected', [
+    (380501111111, '380501111111'),
+    (380501111111.0, '380501111111'),
+    (' 050 ', '050'),
+    (True, ''),
+    (None, ''),
+])
+def test_value_text_matches_cell_text(value, expected):
+    assert sts._value_text(value) == expected
+
+
+class _FakeValuesGet:
+    def __init__(self, column):
+        self.column = column
+
+    def values(self):
+        return self
+
+    def get(self, **kwargs):
+        return self
+
+    def execute(self):
+        return {'values': [self.column]} if self.column else {}
+
+
+@pytest.mark.parametrize('column, matches', [
+    ([380501111111, '', '0502222222'], True),
+    # рядок вставили вручну — телефони зсунулись
+    (['', 380501111111, '', '0502222222'], False),
+    # телефон додали вручну
+    ([380501111111, '0503333333', '0502222222'], False),
+    # рядки відсортували
+    (['0502222222', '', 380501111111], False),
+])
+def test_phone_column_matches_detects_moved_rows(column, matches):
+    sheets = object.__new__(sts.SheetsManager)
+    sheets.spreadsheet_id, sheets.sheet_name = 'sheet-id', 'Клієнти'
+    sheets._local = SimpleNamespace(sheets=SimpleNamespace(spreadsheets=lambda: _FakeValuesGet(column)))
+    index = {'380501111111': 2, '380502222222': 4}
+    assert sheets._phone_column_matches(index, 4) is matches
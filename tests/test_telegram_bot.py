@@ -0,0 +1,53 @@
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Модуль при імпорті підключається до Postgres і Drive — підміняємо лише ці дві межі
+with mock.patch('psycopg2.pool.ThreadedConnectionPool'), \
+        mock.patch('google.oauth2.service_account.Credentials.from_service_account_file'), \
+        mock.patch('googleapiclient.discovery.build'):
+    import telegram_bot as tb  # noqa: E402
+
+
+def _checklist_text_reference(uploaded_types):
+    """Чек-лист, як його збирав цикл до переходу на готові рядки"""
+    message = "<b>Обов'язкові документи:</b>\n"
+    for doc_key in tb.REQUIRED_DOCUMENTS:
+        doc_info = tb.DOCUMENT_TYPES[doc_key]
+        emoji = doc_info['emoji']
+        name = doc_info.get('short', doc_info['name'])
+        if doc_key in uploaded_types:
+            count = uploaded_types[doc_key]
+            if doc_info.get('multiple'):
+                message += f"✅ {emoji} {name} ({count} файл(ів))\n"
+            else:
+                message += f"✅ {emoji} {name}\n"
+        else:
+            message += f"❌ {emoji} {name}\n"
+
+    optional_docs = [k for k in tb.DOCUMENT_TYPES.keys() if k not in tb.REQUIRED_DOCUMENTS]
+    if optional_docs:
+        message += "\n<b>Додаткові документи:</b>\n"
+        for doc_key in optional_docs:
+            doc_info = tb.DOCUMENT_TYPES[doc_key]
+            emoji = doc_info['emoji']
+            name = doc_info.get('short', doc_info['name'])
+            if doc_key in uploaded_types:
+                message += f"✅ {emoji} {name} ({uploaded_types[doc_key]})\n"
+            else:
+                message += f"⚪️ {emoji} {name}\n"
+    return message
+
+
+@pytest.mark.parametrize('uploaded_types', [
+    {},
+    {key: 1 for key in tb.DOCUMENT_TYPES},
+    {tb.REQUIRED_DOCUMENTS[0]: 3, tb.OPTIONAL_DOCUMENTS[-1]: 2} if tb.OPTIONAL_DOCUMENTS else {tb.REQUIRED_DOCUMENTS[0]: 3},
+    {'unknown_type': 5},
+])
+def test_checklist_documents_text_matches_reference(uploaded_types):
+    assert tb.checklist_documents_text(uploaded_types) == _checklist_text_reference(uploaded_types)